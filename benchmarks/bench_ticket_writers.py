@@ -0,0 +1,96 @@
+"""
+Compares the throughput of writing ticket tables through `TableWriterSet` with the previous behavior,
+which reopened all four output files in append mode for every ticket.
+
+Usage:
+
+    python benchmarks/bench_ticket_writers.py --tickets 50000 --buffer-size 1048576
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+
+from writers import TableWriterSet, DEFAULT_BUFFER_SIZE  # noqa: E402
+
+TICKET_COLUMNS = ['id', 'company', 'code', 'state', 'type', 'owner']
+ORDER_COLUMNS = ['ticket_id', 'id', 'code', 'remote_id', 'order_date', 'currency']
+PRODUCT_COLUMNS = ['ticket_id', 'id', 'bound_order_item', 'price_with_vat', 'name', 'manufacturer']
+HISTORY_COLUMNS = ['ticket_id', 'id', 'history_item_type', 'text']
+
+
+def ticket_rows(ticket_count, products=3, history_items=8):
+    """Yields tuples of (ticket row, order row, product rows, history rows) for synthetic tickets"""
+    for ticket_id in range(1, ticket_count + 1):
+        yield (
+            [ticket_id, 1, f'T{ticket_id}', 2, 3, 4],
+            [ticket_id, ticket_id, f'O{ticket_id}', f'R{ticket_id}', '2024-01-01', 'CZK'],
+            [[ticket_id, ticket_id * 10 + i, i, '199.90', f'Product {i}', 'ACME'] for i in range(products)],
+            [[ticket_id, ticket_id * 100 + i, 'note', f'History item {i} of ticket {ticket_id}']
+             for i in range(history_items)],
+        )
+
+
+def write_reopening(folder, rows):
+    paths = [os.path.join(folder, f'{name}.csv') for name in ('tickets', 'bound_orders', 'products', 'history')]
+    for path, columns in zip(paths, (TICKET_COLUMNS, ORDER_COLUMNS, PRODUCT_COLUMNS, HISTORY_COLUMNS)):
+        with open(path, 'w', newline='') as file:
+            csv.writer(file).writerow(columns)
+
+    written = 0
+    for ticket, order, products, history in rows:
+        with open(paths[0], 'a', newline='') as file:
+            csv.writer(file).writerow(ticket)
+        with open(paths[1], 'a', newline='') as file:
+            csv.writer(file).writerow(order)
+        with open(paths[2], 'a', newline='') as file:
+            csv.writer(file).writerows(products)
+        with open(paths[3], 'a', newline='') as file:
+            csv.writer(file).writerows(history)
+        written += 2 + len(products) + len(history)
+    return written
+
+
+def write_writer_set(folder, rows, buffer_size):
+    written = 0
+    with TableWriterSet(folder, buffer_size) as tables:
+        tables.add_table('tickets', TICKET_COLUMNS)
+        tables.add_table('bound_orders', ORDER_COLUMNS)
+        tables.add_table('products', PRODUCT_COLUMNS)
+        tables.add_table('history', HISTORY_COLUMNS)
+        for ticket, order, products, history in rows:
+            tables.writerow('tickets', ticket)
+            tables.writerow('bound_orders', order)
+            tables.writerows('products', products)
+            tables.writerows('history', history)
+            written += 2 + len(products) + len(history)
+    return written
+
+
+def measure(name, write, ticket_count):
+    with tempfile.TemporaryDirectory() as folder:
+        started = time.perf_counter()
+        written = write(folder, ticket_rows(ticket_count))
+        elapsed = time.perf_counter() - started
+    print(f"{name:<16} {written:>10} rows {elapsed:>8.2f} s {written / elapsed:>12,.0f} rows/s")
+    return written / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=20000, help='number of synthetic tickets')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE, help='write buffer size in bytes')
+    args = parser.parse_args()
+
+    reopening = measure('reopen per row', write_reopening, args.tickets)
+    writer_set = measure('writer set', lambda folder, rows: write_writer_set(folder, rows, args.buffer_size),
+                         args.tickets)
+    print(f"speedup: {writer_set / reopening:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
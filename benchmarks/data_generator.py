@@ -0,0 +1,90 @@
+"""
+Generates synthetic Retino data for benchmarks and tests.
+
+Tickets have a realistic fan-out: a bound order, a few products and a longer tail of history items,
+with `updated_at` spread over the generated period. The output is deterministic for a given seed.
+"""
+import datetime
+import random
+
+LANGUAGES = ["en", "cs", "sk", "de"]
+
+
+def isoformat(timestamp):
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def translations(rng, text):
+    return {lang: f"{text} ({lang})" for lang in rng.sample(LANGUAGES, rng.randint(1, len(LANGUAGES)))}
+
+
+def generate_ticket(rng, ticket_id, updated_at, products=(1, 5), history_items=(2, 30)):
+    order_id = 100000 + ticket_id
+    return {
+        "id": ticket_id,
+        "company": rng.randint(1, 3),
+        "code": f"RMA{ticket_id:08d}",
+        "state": rng.randint(1, 8),
+        "type": rng.randint(1, 4),
+        "owner": rng.randint(1, 20),
+        "created_at": isoformat(updated_at - datetime.timedelta(days=rng.randint(0, 30))),
+        "updated_at": isoformat(updated_at),
+        "bound_order": {
+            "id": order_id,
+            "code": f"ORD{order_id}",
+            "remote_id": str(rng.randint(10 ** 6, 10 ** 7)),
+            "order_date": (updated_at - datetime.timedelta(days=rng.randint(1, 60))).strftime('%Y-%m-%d'),
+            "currency": rng.choice(["CZK", "EUR", "PLN"]),
+        },
+        "products": [{
+            "id": ticket_id * 100 + i,
+            "bound_order_item": order_id * 10 + i,
+            "price": {"with_vat": f"{rng.uniform(50, 5000):.2f}", "without_vat": "0.00"},
+            "name": f"Product {rng.randint(1, 5000)}",
+            "manufacturer": rng.choice(["ACME", "Globex", "Initech", "Umbrella"]),
+        } for i in range(rng.randint(*products))],
+        "history_items": [{
+            "id": ticket_id * 1000 + i,
+            "history_item_type": rng.choice(["note", "state_change", "email", "sms"]),
+            "history_item_data": {"text": f"History item {i} of ticket {ticket_id} " + "x" * rng.randint(0, 200)},
+        } for i in range(rng.randint(*history_items))],
+    }
+
+
+def generate_tickets(count, seed=42, period_end=None, period_days=365, **fan_out):
+    """Generates `count` tickets ordered by id, updated during `period_days` days before `period_end`
+
+    Args:
+        fan_out: (min, max) number of `products` and `history_items` of a ticket
+    """
+    rng = random.Random(seed)
+    period_end = period_end or datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+    period = period_days * 24 * 3600
+    return [generate_ticket(rng, ticket_id, period_end - datetime.timedelta(seconds=rng.randint(0, period)),
+                            **fan_out)
+            for ticket_id in range(1, count + 1)]
+
+
+def generate_settings(seed=42):
+    """Generates records of all settings endpoints"""
+    rng = random.Random(seed)
+
+    def custom_fields():
+        return [{"id": i, "type": rng.choice(["text", "select"]), "position": i,
+                 "name": translations(rng, f"Field {i}"),
+                 "options": [{"id": i * 10 + j, "label": translations(rng, f"Option {j}")} for j in range(3)]}
+                for i in range(1, 11)]
+
+    return {
+        "custom-fields": custom_fields(),
+        "product-custom-fields": custom_fields(),
+        "refund-accounts": [{"id": i, "name": f"Account {i}", "bank_account": f"{i}123456/0100",
+                             "currency": "CZK", "due_date": 14} for i in range(1, 4)],
+        "states": [{"id": i, "name": translations(rng, f"State {i}")} for i in range(1, 9)],
+        "tags": [{"id": i, "fgcolor": "#000000", "bgcolor": "#ffffff", "name": translations(rng, f"Tag {i}")}
+                 for i in range(1, 16)],
+        "types": [{"id": i, "name": translations(rng, f"Type {i}")} for i in range(1, 5)],
+        "users": [{"id": i, "role": "admin", "email": f"user{i}@example.com", "full_name": f"User {i}",
+                   "phone_number": "", "last_activity_at": None, "date_joined": "2023-01-01T00:00:00Z"}
+                  for i in range(1, 21)],
+    }
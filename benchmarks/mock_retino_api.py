@@ -0,0 +1,186 @@
+"""
+Local stand-in for the Retino API v2, serving synthetic data from `data_generator`.
+
+Implements `GET /api/v2/{endpoint}` with `page`, `page_size` and `updated_at_from` query parameters, returns
+`count`, `total_pages` and `results`, and supports gzip responses and ETags. Latency and errors (502 and 429
+with `Retry-After`) can be injected. `GET /__stats` returns the number of requests, errors and bytes sent.
+
+Usage:
+
+    python benchmarks/mock_retino_api.py --tickets 10000 --port 8080 --latency 0.05
+
+and set the `api_base_url` parameter of the component to `http://localhost:8080/api/v2/`.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from data_generator import generate_settings, generate_tickets
+
+API_PREFIX = "/api/v2/"
+
+
+class MockRetinoApi:
+    """
+    Serves the given data on a local port in a background thread.
+
+    Usage:
+
+        with MockRetinoApi(tickets, settings, latency=0.01) as api:
+            client = RetinoClient('token', base_url=api.base_url)
+    """
+
+    def __init__(self, tickets, settings=None, port=0, latency=0.0, jitter=0.0, error_rate=0.0, compress=True,
+                 seed=0):
+        self.data = dict(settings or {})
+        self.data["tickets"] = tickets
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.compress = compress
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0}
+        self.stats_lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}{API_PREFIX}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key, value=1):
+        with self.stats_lock:
+            self.stats[key] += value
+
+    def page(self, endpoint, query):
+        """Returns the status and the body of a page of an endpoint"""
+        records = self.data.get(endpoint)
+        if records is None:
+            return 404, {"detail": "Not found."}
+        try:
+            page = int(query.get("page", 1))
+            page_size = int(query.get("page_size", 100))
+        except ValueError:
+            return 400, {"detail": "Invalid page."}
+
+        updated_at_from = query.get("updated_at_from")
+        if updated_at_from:
+            records = [record for record in records if record.get("updated_at", "") >= updated_at_from]
+        updated_at_to = query.get("updated_at_to")
+        if updated_at_to:
+            records = [record for record in records if record.get("updated_at", "") < updated_at_to]
+
+        total_pages = max(1, math.ceil(len(records) / page_size))
+        if page < 1 or page > total_pages:
+            return 404, {"detail": "Invalid page."}
+        return 200, {"count": len(records), "total_pages": total_pages, "page": page,
+                     "results": records[(page - 1) * page_size:page * page_size]}
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/__stats":
+                    with api.stats_lock:
+                        stats = dict(api.stats)
+                    return self.send_json(200, stats)
+
+                api.count("requests")
+                if api.latency or api.jitter:
+                    time.sleep(api.latency + api.rng.uniform(0, api.jitter))
+                if not self.headers.get("Authorization"):
+                    return self.send_json(401, {"detail": "Authentication credentials were not provided."})
+                if api.error_rate and api.rng.random() < api.error_rate:
+                    api.count("errors")
+                    if api.rng.random() < 0.5:
+                        return self.send_json(429, {"detail": "Request was throttled."}, {"Retry-After": "0"})
+                    return self.send_json(502, {"detail": "Bad gateway."})
+                if not url.path.startswith(API_PREFIX):
+                    return self.send_json(404, {"detail": "Not found."})
+
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                status, body = api.page(url.path[len(API_PREFIX):].strip("/"), query)
+                self.send_json(status, body)
+
+            def send_json(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                etag = f'"{hashlib.md5(payload).hexdigest()}"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    status, payload = 304, b""
+                headers = dict(headers or {})
+                if payload and api.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    payload = gzip.compress(payload, compresslevel=1)
+                    headers["Content-Encoding"] = "gzip"
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                if status in (200, 304):
+                    self.send_header("ETag", etag)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+                api.count("bytes", len(payload))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Retino API v2")
+    parser.add_argument("--tickets", type=int, default=10000, help="number of generated tickets")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the data generator")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="latency of each response in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random latency added to each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 502 or 429")
+    args = parser.parse_args()
+
+    api = MockRetinoApi(generate_tickets(args.tickets, seed=args.seed), generate_settings(seed=args.seed),
+                        port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    print(f"Serving {args.tickets} tickets on {api.base_url}", flush=True)
+    try:
+        api.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
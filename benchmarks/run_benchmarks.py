@@ -0,0 +1,170 @@
+"""
+End-to-end benchmark of the component against the local mock Retino API.
+
+Each scenario runs the component in a separate process on a fresh data folder and reports the wall-clock time,
+rows written per second, peak RSS of the component process and the number of API requests.
+
+Usage:
+
+    python benchmarks/run_benchmarks.py --tickets 20000 --latency 0.02 --param page_concurrency=4
+
+`--param` sets any component parameter (the value is parsed as JSON when possible) for all scenarios.
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCHMARKS_DIR = os.path.dirname(os.path.realpath(__file__))
+COMPONENT_PATH = os.path.join(BENCHMARKS_DIR, '..', 'src', 'component.py')
+sys.path.append(BENCHMARKS_DIR)
+
+from data_generator import generate_settings, generate_tickets  # noqa: E402
+from mock_retino_api import MockRetinoApi  # noqa: E402
+
+# generated tickets are updated during the year before this moment
+PERIOD_END = datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+
+SCENARIOS = {
+    "full": {"data_selection": "all data", "incremental_update": False},
+    "incremental": {"data_selection": "only tickets", "incremental_update": True},
+}
+
+# runs the component and stores the peak RSS of its process, the component exits with sys.exit
+RUNNER = """
+import json, os, resource, runpy, sys
+sys.path.insert(0, os.path.dirname(sys.argv[1]))
+try:
+    runpy.run_path(sys.argv[1], run_name='__main__')
+finally:
+    with open(sys.argv[2], 'w') as rss_file:
+        json.dump({'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}, rss_file)
+"""
+
+
+def serve(queue, tickets, seed, latency, jitter, error_rate):
+    api = MockRetinoApi(generate_tickets(tickets, seed=seed, period_end=PERIOD_END), generate_settings(seed=seed),
+                        latency=latency, jitter=jitter, error_rate=error_rate)
+    queue.put(api.base_url)
+    api.serve_forever()
+
+
+def api_stats(base_url):
+    stats_url = base_url.split('/api/v2/')[0] + '/__stats'
+    with urllib.request.urlopen(stats_url) as response:
+        return json.load(response)
+
+
+def count_rows(tables_folder):
+    """Counts data rows of all output tables, including sliced and gzipped ones"""
+    rows = 0
+    for name in os.listdir(tables_folder):
+        path = os.path.join(tables_folder, name)
+        if os.path.isdir(path):
+            for slice_name in os.listdir(path):
+                opener = gzip.open if slice_name.endswith('.gz') else open
+                with opener(os.path.join(path, slice_name), 'rt', newline='') as file:
+                    rows += sum(1 for _ in csv.reader(file))
+        elif name.endswith('.csv'):
+            with open(path, newline='') as file:
+                rows += sum(1 for _ in csv.reader(file)) - 1
+    return rows
+
+
+def run_scenario(name, base_url, parameters, state):
+    with tempfile.TemporaryDirectory() as data_dir:
+        for folder in ('in', os.path.join('out', 'tables'), os.path.join('out', 'files')):
+            os.makedirs(os.path.join(data_dir, folder))
+        with open(os.path.join(data_dir, 'config.json'), 'w') as config_file:
+            json.dump({'parameters': parameters}, config_file)
+        with open(os.path.join(data_dir, 'in', 'state.json'), 'w') as state_file:
+            json.dump(state, state_file)
+
+        rss_path = os.path.join(data_dir, 'rss.json')
+        before = api_stats(base_url)
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', RUNNER, os.path.realpath(COMPONENT_PATH), rss_path],
+                                env={**os.environ, 'KBC_DATADIR': data_dir}, capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        after = api_stats(base_url)
+        if result.returncode:
+            sys.stderr.write(result.stderr)
+            raise SystemExit(f"Scenario {name} failed with exit code {result.returncode}")
+
+        with open(rss_path) as rss_file:
+            max_rss_kb = json.load(rss_file)['max_rss_kb']
+        rows = count_rows(os.path.join(data_dir, 'out', 'tables'))
+
+    return {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "rows": rows,
+        "rows_per_second": round(rows / elapsed),
+        "peak_rss_mb": round(max_rss_kb / 1024, 1),
+        "requests": after["requests"] - before["requests"],
+        "injected_errors": after["errors"] - before["errors"],
+        "bytes_received": after["bytes"] - before["bytes"],
+    }
+
+
+def parse_param(value):
+    key, _, raw = value.partition('=')
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=10000, help='number of generated tickets')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the data generator')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency of each API response in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random latency added to each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with 502 or 429')
+    parser.add_argument('--incremental-days', type=float, default=7,
+                        help='age of the incremental watermark in days')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, all scenarios by default')
+    parser.add_argument('--param', action='append', default=[], type=parse_param,
+                        help='component parameter as key=value, e.g. page_concurrency=4')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, daemon=True,
+                                     args=(queue, args.tickets, args.seed, args.latency, args.jitter,
+                                           args.error_rate))
+    server.start()
+    base_url = queue.get(timeout=600)
+
+    watermark = PERIOD_END - datetime.timedelta(days=args.incremental_days)
+    results = []
+    try:
+        for name in args.scenario or sorted(SCENARIOS):
+            parameters = {'#api_token': 'benchmark', 'api_base_url': base_url, **SCENARIOS[name],
+                          **dict(args.param)}
+            state = {'lastTicketsUpdate': int(watermark.timestamp())} if parameters['incremental_update'] else {}
+            results.append(run_scenario(name, base_url, parameters, state))
+    finally:
+        server.terminate()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'scenario':<12} {'seconds':>8} {'rows':>10} {'rows/s':>10} {'peak RSS MB':>12} {'requests':>9}")
+    for result in results:
+        print(f"{result['scenario']:<12} {result['seconds']:>8.2f} {result['rows']:>10} "
+              f"{result['rows_per_second']:>10} {result['peak_rss_mb']:>12.1f} {result['requests']:>9}")
+
+
+if __name__ == '__main__':
+    main()
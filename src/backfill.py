@@ -0,0 +1,98 @@
+"""
+Time-window partitioned backfill of tickets.
+
+A full load of tickets is split into windows of their last update, which are downloaded in parallel, each to its
+own partial tables. The partial tables are merged into the output tables afterwards. A ticket updated during the
+backfill moves to a later window, so it can be received in two windows. The merge keeps only its copy from the
+latest window.
+"""
+import csv
+import datetime
+import os
+
+from dedup import RecordIndex
+
+
+def parse_date(value):
+    """Parses a date or a timestamp of the `backfill` parameter to an aware datetime in UTC"""
+    timestamp = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp.astimezone(datetime.timezone.utc)
+
+
+def backfill_windows(start, window_days, end=None):
+    """Splits the period from `start` to `end` into windows of `window_days` days
+
+    Without `end`, the last window has no upper bound, so it includes tickets updated during the backfill.
+
+    Returns:
+        list: (from, to) datetimes of each window, oldest first
+    """
+    step = datetime.timedelta(days=window_days)
+    windows = []
+    current = start
+    while end is None or current < end:
+        upper = current + step
+        if end is None and upper >= datetime.datetime.now(datetime.timezone.utc):
+            windows.append((current, None))
+            break
+        windows.append((current, min(upper, end) if end is not None else upper))
+        current = upper
+    return windows
+
+
+def window_key(window):
+    """Identifies a window in the state"""
+    return window[0].isoformat()
+
+
+def read_table_rows(path):
+    """Yields data rows of a partial CSV table written with a header"""
+    with open(path, newline='') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        yield from reader
+
+
+def merge_windows(folders, tables, table_names):
+    """Merges partial tables of backfill windows into the output tables
+
+    The first table has one row per ticket with its id in the first column, the other tables have the ticket id
+    in the first column too. Windows are merged from the latest one, and a ticket already merged from a later
+    window is skipped with all its rows. Rows of a ticket received twice within a window are all kept, as the
+    window wrote them.
+
+    Args:
+        folders (list): Folders with the partial tables of each window, oldest first
+        tables (TableWriterSet): Output tables, with `table_names` added
+        table_names (list): Names of the tables, the ticket table first
+
+    Returns:
+        int: Number of skipped tickets received in more than one window
+    """
+    merged = RecordIndex()
+    duplicates = 0
+    for folder in reversed(folders):
+        skipped = set()
+        # ids of tickets merged from this window
+        window_ids = set()
+        for name in table_names:
+            path = os.path.join(folder, f'{name}.csv')
+            writerow = tables.writer(name).writerow
+            if name == table_names[0]:
+                for row in read_table_rows(path):
+                    ticket_id = int(row[0]) if row[0].isdigit() else row[0]
+                    if merged.add_id(ticket_id) or ticket_id in window_ids:
+                        window_ids.add(ticket_id)
+                        writerow(row)
+                    else:
+                        skipped.add(row[0])
+            elif skipped:
+                for row in read_table_rows(path):
+                    if row[0] not in skipped:
+                        writerow(row)
+            else:
+                tables.writerows(name, read_table_rows(path))
+        duplicates += len(skipped)
+    return duplicates
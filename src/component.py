@@ -1,26 +1,149 @@
-import csv
 import json
 import os
 import logging
 import requests
 import datetime
+import functools
+import hashlib
+import itertools
+import collections
+import multiprocessing
+import queue
+import threading
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from keboola.component.base import ComponentBase
 from keboola.component.exceptions import UserException
 
+import decoding
+from backfill import backfill_windows, merge_windows, parse_date, window_key
+from dedup import RecordIndex
+from flattener import Flattener, SCHEMAS, flatten_to_csv
+from metrics import RunMetrics
+from page_cache import PageCache, MODES as PAGE_CACHE_MODES, REPLAY
+from paging import AdaptivePageSize
+from profiling import StageProfiler, DEFAULT_TOP as PROFILE_TOP
+from ratelimit import RateLimiter
+from retino_client import RetinoClient, BASE_URL
+from scheduler import EndpointScheduler
+from writers import TableWriterSet, DEFAULT_BUFFER_SIZE, DEFAULT_SLICE_ROWS
+
 
 # configuration variables
 KEY_API_TOKEN = '#api_token'
 KEY_DATA_TABLES = "data_selection"
 KEY_INCREMENTAL_UPDATE = "incremental_update"
+KEY_WRITE_BUFFER_SIZE = "write_buffer_size"
+KEY_PAGE_CONCURRENCY = "page_concurrency"
+KEY_ENDPOINT_CONCURRENCY = "endpoint_concurrency"
+KEY_MAX_RETRIES = "max_retries"
+KEY_PAGE_SIZE = "page_size"
+KEY_ADAPTIVE_PAGE_SIZE = "adaptive_page_size"
+KEY_WATERMARK_OVERLAP = "watermark_overlap_minutes"
+KEY_SETTINGS_CACHE = "settings_cache"
+KEY_OUTPUT_SLICING = "output_slicing"
+KEY_API_BASE_URL = "api_base_url"
+KEY_RUN_METRICS = "run_metrics"
+KEY_STREAMING_DECODE = "streaming_decode"
+KEY_DEDUPLICATE_TICKETS = "deduplicate_tickets"
+KEY_BACKFILL = "backfill"
+KEY_RATE_LIMIT = "rate_limit"
+KEY_PAGE_CACHE = "page_cache"
+KEY_FLATTEN_PROCESSES = "flatten_processes"
+KEY_CHANGE_PREFLIGHT = "change_preflight"
+KEY_PROFILING = "profiling"
+KEY_PIPELINE_PAGES = "pipeline_pages"
+
+# number of endpoints downloaded at the same time
+DEFAULT_ENDPOINT_CONCURRENCY = 4
+# number of retries of a failed request before the endpoint fails
+DEFAULT_MAX_RETRIES = 5
+# page sizes used unless configured otherwise, incremental tickets use smaller pages by default
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_INCREMENTAL_PAGE_SIZE = 10
+# minutes subtracted from the newest ticket update when storing the incremental watermark
+DEFAULT_WATERMARK_OVERLAP = 5
+# length of a window of a tickets backfill in days and the number of windows downloaded at the same time
+DEFAULT_BACKFILL_WINDOW_DAYS = 30
+DEFAULT_BACKFILL_WORKERS = 4
+# number of tickets flattened by a worker process at once, and the number of batches queued per process
+FLATTEN_BATCH_SIZE = 200
+FLATTEN_BATCHES_PER_PROCESS = 2
+# pages fetched ahead of the writer of an endpoint, and how often a blocked fetcher checks that the writer stopped
+DEFAULT_PIPELINE_PAGES = 4
+PIPELINE_POLL_SECONDS = 0.5
+# tables written in slices when output slicing is enabled without a list of tables
+DEFAULT_SLICED_TABLES = ["tickets", "tickets_bound_orders", "tickets_products", "tickets_history"]
 
 # list of mandatory parameters => if some is missing,
 # component will fail with readable message on initialization.
 REQUIRED_PARAMETERS = [KEY_API_TOKEN, KEY_DATA_TABLES]
 
+# state key of the checkpoint of an unfinished tickets download
+STATE_TICKETS_CHECKPOINT = "ticketsCheckpoint"
+# state keys of the progress of a single tickets download, restored when its tables are discarded
+TICKETS_PROGRESS_STATE = [STATE_TICKETS_CHECKPOINT, "lastTicketsUpdate"]
+# state key of the progress of an unfinished tickets backfill
+STATE_TICKETS_BACKFILL = "ticketsBackfill"
+# state key of the ETags and hashes of settings endpoints
+STATE_SETTINGS_CACHE = "settingsCache"
+# increase when the output of settings tables changes, so cached endpoints are written again
+SETTINGS_CACHE_VERSION = 1
+
+# file with runtime metrics of the run written to the output files, tagged so reports of all runs can be found
+METRICS_FILE_NAME = "retino_run_metrics.json"
+METRICS_FILE_TAGS = ["retino-run-metrics"]
+# profiles of stages written to the output files when profiling is enabled
+PROFILE_FILE_PREFIX = "retino_profile_"
+PROFILE_FILE_TAGS = ["retino-profile"]
+
 # check if exists file with a name of localhost.json in the same directory as the component
 # if yes, set LOCALHOST_MODE to True
 LOCALHOST_MODE = os.path.exists(os.path.join(os.path.dirname(__file__), 'localhost.json'))
 
+# query parameter of the upper bound of ticket updates (exclusive), used by backfill windows
+# it is not documented by the API, so the tickets of each window are checked against the bound
+UPDATED_AT_TO_PARAM = "updated_at_to"
+
+# settings endpoints, tables of all endpoints are declared in flattener.SCHEMAS
+SETTINGS_ENDPOINTS = ["custom-fields", "product-custom-fields", "refund-accounts", "states", "tags", "types", "users"]
+
+
+def parse_timestamp(value):
+    """Parses an ISO 8601 timestamp from the API to an aware datetime in UTC, None if it is missing or invalid"""
+    if not value:
+        return None
+    try:
+        timestamp = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp.astimezone(datetime.timezone.utc)
+
+
+def format_timestamp(timestamp):
+    """Formats an aware datetime as a timestamp filter of the API"""
+    return timestamp.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def max_timestamp(records, current=None):
+    """Returns the newest `updated_at` of the records, or `current` if it is newer"""
+    for record in records:
+        updated_at = parse_timestamp(record.get("updated_at"))
+        if updated_at is not None and (current is None or updated_at > current):
+            current = updated_at
+    return current
+
+
+class IncompleteDownloadError(UserException):
+    """Raised when a download fails after some pages were already written and a checkpoint was recorded"""
+
+
+class StaleCheckpointError(UserException):
+    """Raised when the first page of a resumed download is out of range, so the checkpoint cannot be used"""
+
 
 class Component(ComponentBase):
     """
@@ -35,6 +158,31 @@ class Component(ComponentBase):
 
     def __init__(self):
         super().__init__()
+        self.write_buffer_size = DEFAULT_BUFFER_SIZE
+        self.page_concurrency = 1
+        self.endpoint_concurrency = DEFAULT_ENDPOINT_CONCURRENCY
+        self.max_retries = DEFAULT_MAX_RETRIES
+        self.page_sizes = {}
+        self.adaptive_page_size = None
+        self.watermark_overlap = DEFAULT_WATERMARK_OVERLAP
+        self.settings_cache = False
+        self.output_slicing = None
+        self.api_base_url = BASE_URL
+        self.metrics = RunMetrics()
+        self.streaming_decode = False
+        self.deduplicate_tickets = True
+        self.backfill = None
+        self.rate_limit = {}
+        self.page_cache = None
+        self.flatten_processes = 0
+        self.change_preflight = False
+        self.profiler = StageProfiler()
+        self.pipeline_pages = DEFAULT_PIPELINE_PAGES
+        self.state = self.get_state_file()
+        self.client = None
+        self.client_lock = threading.Lock()
+        self.process_pool = None
+        self.process_pool_lock = threading.Lock()
 
     def run(self):
         """
@@ -47,473 +195,1023 @@ class Component(ComponentBase):
 
         # set the data folder
         self.data_folder = self.tables_out_path
-
-        increment = False
+        self.write_buffer_size = int(params.get(KEY_WRITE_BUFFER_SIZE, DEFAULT_BUFFER_SIZE))
+        self.page_concurrency = max(1, int(params.get(KEY_PAGE_CONCURRENCY, 1)))
+        self.endpoint_concurrency = max(1, int(params.get(KEY_ENDPOINT_CONCURRENCY, DEFAULT_ENDPOINT_CONCURRENCY)))
+        self.max_retries = int(params.get(KEY_MAX_RETRIES, DEFAULT_MAX_RETRIES))
+        self.page_sizes = params.get(KEY_PAGE_SIZE, {})
+        self.adaptive_page_size = self.adaptive_page_size_settings(params.get(KEY_ADAPTIVE_PAGE_SIZE))
+        self.watermark_overlap = float(params.get(KEY_WATERMARK_OVERLAP, DEFAULT_WATERMARK_OVERLAP))
+        self.settings_cache = bool(params.get(KEY_SETTINGS_CACHE, True))
+        self.output_slicing = self.output_slicing_settings(params.get(KEY_OUTPUT_SLICING))
+        self.api_base_url = params.get(KEY_API_BASE_URL, BASE_URL)
+        self.metrics = RunMetrics()
+        self.streaming_decode = bool(params.get(KEY_STREAMING_DECODE, False))
+        if self.streaming_decode and not decoding.STREAMING_AVAILABLE:
+            logging.warning("Streaming decoding requires the ijson library, pages are decoded whole")
+            self.streaming_decode = False
+        self.deduplicate_tickets = bool(params.get(KEY_DEDUPLICATE_TICKETS, True))
+        self.backfill = self.backfill_settings(params.get(KEY_BACKFILL))
+        self.rate_limit = self.rate_limit_settings(params.get(KEY_RATE_LIMIT))
+        self.page_cache = self.page_cache_settings(params.get(KEY_PAGE_CACHE))
+        self.flatten_processes = self.flatten_processes_settings(params.get(KEY_FLATTEN_PROCESSES))
+        self.change_preflight = bool(params.get(KEY_CHANGE_PREFLIGHT, True))
+        self.profiler = self.profiler_settings(params.get(KEY_PROFILING))
+        self.pipeline_pages = max(0, int(params.get(KEY_PIPELINE_PAGES, DEFAULT_PIPELINE_PAGES)))
+        replay = self.page_cache is not None and self.page_cache.replaying
+        if replay:
+            # all tables are rebuilt from the recorded pages
+            logging.info(f"Replaying pages recorded in {self.page_cache.folder}, the API is not called")
+            self.settings_cache = False
+
+        scheduler = EndpointScheduler(self.endpoint_concurrency)
 
         # values for KEY_DATA_TABLES are: "all data", "only tickets", "other resources"
-        if params.get(KEY_DATA_TABLES) == "all data" or params.get(KEY_DATA_TABLES) == "other resources":
-            logging.info("Downloading settings tables")
-
-            # missing processing for endpoint "shipping-routes" as it is not available in the API
-
-            # processing custom-fields
-            endpoint = "custom-fields"
-            logging.info(f"Downloading data for endpoint {endpoint}")
-            try:
-                data = self.get_retino_data(params.get(KEY_API_TOKEN), endpoint, increment)
-                self.process_custom_fields(data, endpoint)
-            except Exception as e:
-                logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
-
-            # processing product-custom-fields
-            endpoint = "product-custom-fields"
-            logging.info(f"Downloading data for endpoint {endpoint}")
-            try:
-                data = self.get_retino_data(params.get(KEY_API_TOKEN), endpoint, increment)
-                self.process_product_custom_fields(data, endpoint)
-            except Exception as e:
-                logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
-
-            # processing refund-accounts
-            endpoint = "refund-accounts"
-            logging.info(f"Downloading data for endpoint {endpoint}")
-            try:
-                data = self.get_retino_data(params.get(KEY_API_TOKEN), endpoint, increment)
-                self.process_refund_accounts(data, endpoint)
-            except Exception as e:
-                logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
-
-            endpoint = "states"
-            logging.info(f"Downloading data for endpoint {endpoint}")
-            try:
-                data = self.get_retino_data(params.get(KEY_API_TOKEN), endpoint, increment)
-                self.process_states(data, endpoint)
-            except Exception as e:
-                logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
-
-            # processing tags
-            endpoint = "tags"
-            logging.info(f"Downloading data for endpoint {endpoint}")
-            try:
-                data = self.get_retino_data(params.get(KEY_API_TOKEN), endpoint, increment)
-                self.process_tags(data, endpoint)
-            except Exception as e:
-                logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
-
-            # processing types
-            endpoint = "types"
-            logging.info(f"Downloading data for endpoint {endpoint}")
-            try:
-                data = self.get_retino_data(params.get(KEY_API_TOKEN), endpoint, increment)
-                self.process_types(data, endpoint)
-            except Exception as e:
-                logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
-
-            # processing users
-            endpoint = "users"
-            logging.info(f"Downloading data for endpoint {endpoint}")
-            try:
-                data = self.get_retino_data(params.get(KEY_API_TOKEN), endpoint, increment)
-                self.process_users(data, endpoint)
-            except Exception as e:
-                logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
-
+        # tickets are by far the longest job, so they are scheduled first
         if params.get(KEY_DATA_TABLES) == "all data" or params.get(KEY_DATA_TABLES) == "only tickets":
 
             # set incremental update flag for tickets only
             increment = params.get(KEY_INCREMENTAL_UPDATE, False)
 
             endpoint = "tickets"
-            logging.info(f"Downloading data for endpoint {endpoint}")
-            try:
-                data = self.get_retino_data(params.get(KEY_API_TOKEN), endpoint, increment)
-                self.process_tickets(data, endpoint, increment)
-            except Exception as e:
-                logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
+            scheduler.add(endpoint, self.download_endpoint, params.get(KEY_API_TOKEN), endpoint, increment)
 
-    def process_custom_fields(self, data, endpoint):
-        """Processes data from specific endpoint and saves it to CSV files
+        if params.get(KEY_DATA_TABLES) == "all data" or params.get(KEY_DATA_TABLES) == "other resources":
+            logging.info("Downloading settings tables")
 
-        Args:
-            data (dict): The data to be sent to the endpoint
-            endpoint (str): The URL of the endpoint
+            # missing processing for endpoint "shipping-routes" as it is not available in the API
+            for endpoint in SETTINGS_ENDPOINTS:
+                scheduler.add(endpoint, self.download_endpoint, params.get(KEY_API_TOKEN), endpoint)
+
+        self.profiler.start()
+        try:
+            scheduler.run()
+            # a replay keeps the state of the recorded run, so it can be repeated
+            with self.profiler.stage("state"):
+                self.write_state_file(self.get_state_file() if replay else self.state)
+        finally:
+            self.profiler.stop()
+            if self.client is not None:
+                self.client.close()
+            if self.process_pool is not None:
+                self.process_pool.shutdown()
+
+        self.metrics.record_results(scheduler.results)
+        if params.get(KEY_RUN_METRICS, True):
+            self.write_metrics_report()
+        if self.profiler.enabled:
+            self.write_profiles()
+        logging.info(self.metrics.summary())
+        # the run log ends with the time spent on each endpoint
+        scheduler.log_summary()
+
+    def write_metrics_report(self):
+        """Writes the runtime metrics of the run as a JSON file to the output files"""
+        file_definition = self.create_out_file_definition(METRICS_FILE_NAME, tags=METRICS_FILE_TAGS)
+        self.metrics.write(file_definition.full_path)
+        self.write_manifest(file_definition)
+
+    def write_profiles(self):
+        """Writes the cProfile statistics and the text report of each profiled stage to the output files"""
+        for stage in self.profiler.stages:
+            name = f"{PROFILE_FILE_PREFIX}{stage.replace('-', '_')}"
+            profile = self.create_out_file_definition(f"{name}.prof", tags=PROFILE_FILE_TAGS)
+            report = self.create_out_file_definition(f"{name}.txt", tags=PROFILE_FILE_TAGS)
+            self.profiler.write_stage(stage, profile.full_path, report.full_path)
+            self.write_manifest(profile)
+            self.write_manifest(report)
+        logging.info(f"Profiles of {len(self.profiler.stages)} stages written to the output files")
+
+    @staticmethod
+    def profiler_settings(config):
+        """Translates the `profiling` parameter to a StageProfiler, disabled unless the parameter is set"""
+        if not config or (isinstance(config, dict) and not config.get("enabled", True)):
+            return StageProfiler()
+        config = config if isinstance(config, dict) else {}
+        return StageProfiler(enabled=True, allocations=bool(config.get("allocations", True)),
+                             top=int(config.get("top", PROFILE_TOP)))
+
+    @staticmethod
+    def flatten_processes_settings(config):
+        """Translates the `flatten_processes` parameter to the number of worker processes, 0 if disabled"""
+        if config == "auto":
+            return os.cpu_count() or 1
+        processes = int(config or 0)
+        # a single worker process would only add the transfer of records to the flattening
+        return processes if processes > 1 else 0
+
+    @staticmethod
+    def adaptive_page_size_settings(config):
+        """Translates the `adaptive_page_size` parameter to AdaptivePageSize arguments, None if disabled"""
+        if not config or (isinstance(config, dict) and not config.get("enabled", True)):
+            return None
+        config = config if isinstance(config, dict) else {}
+        settings = {}
+        if "min_page_size" in config:
+            settings["min_size"] = int(config["min_page_size"])
+        if "max_page_size" in config:
+            settings["max_size"] = int(config["max_page_size"])
+        if "max_response_time" in config:
+            settings["max_response_time"] = float(config["max_response_time"])
+        if "max_response_mb" in config:
+            settings["max_response_bytes"] = int(float(config["max_response_mb"]) * 1024 * 1024)
+        return settings
+
+    @staticmethod
+    def backfill_settings(config):
+        """Translates the `backfill` parameter to the period, window length and workers, None if disabled"""
+        if not config or not isinstance(config, dict) or not config.get("enabled", True):
+            return None
+        if not config.get("from"):
+            raise UserException("The backfill parameter requires the date of the oldest ticket update in 'from'.")
+        try:
+            start = parse_date(config["from"])
+            end = parse_date(config["to"]) if config.get("to") else None
+        except ValueError as e:
+            raise UserException(f"Invalid date in the backfill parameter: {str(e)}") from e
+        return {"start": start, "end": end,
+                "window_days": max(1, int(config.get("window_days", DEFAULT_BACKFILL_WINDOW_DAYS))),
+                "workers": max(1, int(config.get("workers", DEFAULT_BACKFILL_WORKERS)))}
+
+    @staticmethod
+    def rate_limit_settings(config):
+        """Translates the `rate_limit` parameter to RateLimiter arguments
+
+        The parameter is either the number of requests per second, or an object, e.g.
+        `{"requests_per_second": 10, "burst": 20}`. Without it, requests are limited only after the API throttles them.
+        """
+        if not config:
+            return {}
+        if not isinstance(config, dict):
+            return {"rate": float(config)}
+        settings = {}
+        if config.get("requests_per_second"):
+            settings["rate"] = float(config["requests_per_second"])
+        if config.get("burst"):
+            settings["burst"] = float(config["burst"])
+        return settings
+
+    def page_cache_settings(self, config):
+        """Returns the PageCache configured by the `page_cache` parameter, None if disabled
+
+        The parameter is an object with the `mode` (`record` or `replay`) and an optional `folder`,
+        `page_cache` in the data folder by default.
         """
-        fields_output_path = os.path.join(self.data_folder, f'{endpoint}_fields.csv')
-        names_output_path = os.path.join(self.data_folder, f'{endpoint}_names.csv')
-        options_output_path = os.path.join(self.data_folder, f'{endpoint}_options.csv')
-        option_labels_output_path = os.path.join(self.data_folder, f'{endpoint}_option_labels.csv')
-
-        # Handle each file separately
-        with open(fields_output_path, 'w', newline='') as fields_file:
-            field_writer = csv.writer(fields_file)
-            field_writer.writerow(['id', 'type', 'position'])
-            for field in data:
-                field_writer.writerow([field['id'], field['type'], field['position']])
-
-        with open(names_output_path, 'w', newline='') as names_file:
-            name_writer = csv.writer(names_file)
-            name_writer.writerow(['field_id', 'language_code', 'value'])
-            for field in data:
-                for lang, name in field['name'].items():
-                    name_writer.writerow([field['id'], lang, name])
-
-        with open(options_output_path, 'w', newline='') as options_file:
-            option_writer = csv.writer(options_file)
-            option_writer.writerow(['id', 'field_id'])
-            for field in data:
-                for option in field.get('options', []):
-                    option_writer.writerow([option['id'], field['id']])
-
-        with open(option_labels_output_path, 'w', newline='') as option_labels_file:
-            option_label_writer = csv.writer(option_labels_file)
-            option_label_writer.writerow(['option_id', 'language_code', 'value'])
-            for field in data:
-                for option in field.get('options', []):
-                    for lang, label in option['label'].items():
-                        option_label_writer.writerow([option['id'], lang, label])
-
-        # Creating manifest files
-        self.create_manifest(fields_output_path, ['id'])
-        self.create_manifest(names_output_path, ['field_id', 'language_code'])
-        self.create_manifest(options_output_path, ['id', 'field_id'])
-        self.create_manifest(option_labels_output_path, ['option_id', 'language_code'])
-
-    def process_product_custom_fields(self, data, endpoint):
-        """Processes data from specific endpoint and saves it to CSV files
+        if not config or not isinstance(config, dict) or not config.get("mode"):
+            return None
+        if config["mode"] not in PAGE_CACHE_MODES:
+            raise UserException(f"Unknown page cache mode '{config['mode']}', use one of "
+                                f"{', '.join(PAGE_CACHE_MODES)}.")
+        folder = config.get("folder") or os.path.join(self.data_folder_path, "page_cache")
+        if config["mode"] == REPLAY and not os.path.isdir(folder):
+            raise UserException(f"The page cache folder {folder} does not exist, record the pages first.")
+        return PageCache(folder, config["mode"])
+
+    @staticmethod
+    def output_slicing_settings(config):
+        """Returns the `output_slicing` parameter as a dict, None if slicing is disabled"""
+        if not config or (isinstance(config, dict) and not config.get("enabled", True)):
+            return None
+        return config if isinstance(config, dict) else {}
+
+    def download_endpoint(self, token, endpoint, increment=False):
+        """Downloads data of a single endpoint and writes its output tables
 
         Args:
-            data (dict): The data to be sent to the endpoint
+            token (str): Retino API token
             endpoint (str): The URL of the endpoint
+            increment (bool): Whether only updated records are downloaded, applies to tickets only
+        """
+        with self.profiler.stage(endpoint):
+            logging.info(f"Downloading data for endpoint {endpoint}")
+            if endpoint == "tickets" and self.backfill is not None and (
+                    not increment or "lastTicketsUpdate" not in self.state or STATE_TICKETS_BACKFILL in self.state):
+                # an incremental configuration backfills only until the first backfill completes
+                self.backfill_tickets(token)
+            elif endpoint == "tickets":
+                self.download_tickets(token, increment)
+            elif self.settings_cache:
+                self.download_cached_endpoint(token, endpoint)
+            else:
+                self.process_endpoint(self.iter_retino_records(token, endpoint, increment), endpoint)
+
+    def download_tickets(self, token, increment=False):
+        """Downloads tickets in a single download and writes their output tables
+
+        A download resumes after the checkpoint of a failed run. When the checkpoint no longer fits the tickets
+        of the account, it is dropped and the download starts again from the first page.
         """
-        fields_output_path = os.path.join(self.data_folder, f'{endpoint}_fields.csv')
-        names_output_path = os.path.join(self.data_folder, f'{endpoint}_names.csv')
-        options_output_path = os.path.join(self.data_folder, f'{endpoint}_options.csv')
-        option_labels_output_path = os.path.join(self.data_folder, f'{endpoint}_option_labels.csv')
-
-        # Handling fields file
-        with open(fields_output_path, 'w', newline='') as fields_file:
-            field_writer = csv.writer(fields_file)
-            field_writer.writerow(['id', 'type', 'position'])
-            for field in data:
-                field_writer.writerow([field['id'], field['type'], field['position']])
-
-        # Handling names file
-        with open(names_output_path, 'w', newline='') as names_file:
-            name_writer = csv.writer(names_file)
-            name_writer.writerow(['field_id', 'language_code', 'value'])
-            for field in data:
-                for lang, name in field['name'].items():
-                    name_writer.writerow([field['id'], lang, name])
-
-        # Handling options file
-        with open(options_output_path, 'w', newline='') as options_file:
-            option_writer = csv.writer(options_file)
-            option_writer.writerow(['id', 'field_id'])
-            for field in data:
-                for option in field.get('options', []):
-                    option_writer.writerow([option['id'], field['id']])
-
-        # Handling option labels file
-        with open(option_labels_output_path, 'w', newline='') as option_labels_file:
-            option_label_writer = csv.writer(option_labels_file)
-            option_label_writer.writerow(['option_id', 'language_code', 'value'])
-            for field in data:
-                for option in field.get('options', []):
-                    for lang, label in option['label'].items():
-                        option_label_writer.writerow([option['id'], lang, label])
-
-        # Generate manifest files for each CSV
-        self.create_manifest(fields_output_path, ['id'])
-        self.create_manifest(names_output_path, ['field_id', 'language_code'])
-        self.create_manifest(options_output_path, ['id', 'field_id'])
-        self.create_manifest(option_labels_output_path, ['option_id', 'language_code'])
-
-    def create_manifest(self, csv_file_path, primary_keys, incremental=False):
+        checkpoint = self.tickets_checkpoint(increment)
+        if checkpoint is None and STATE_TICKETS_CHECKPOINT in self.state:
+            logging.info("The checkpoint of the previous download of tickets was made with another filter, "
+                         "the download starts from the first page")
+            self.state.pop(STATE_TICKETS_CHECKPOINT)
+        page_size = None
+        if self.change_preflight and increment and "lastTicketsUpdate" in self.state and checkpoint is None:
+            count = self.count_updated_tickets(token)
+            if count == 0:
+                logging.info("No tickets were updated since the previous run, tickets tables are not written")
+                return
+            page_size = self.preflight_page_size(count)
+        data = self.iter_retino_records(token, "tickets", increment, page_size)
+        try:
+            # a resumed download only adds the remaining pages to the tables loaded by the failed run
+            self.process_endpoint(data, "tickets", increment or checkpoint is not None)
+        except StaleCheckpointError as e:
+            logging.warning(f"{str(e)} The download of tickets starts again from the first page.")
+            self.state.pop(STATE_TICKETS_CHECKPOINT, None)
+            self.download_tickets(token, increment)
+
+    def updated_since_watermark(self):
+        """Returns the `updated_at_from` filter of an incremental download of tickets"""
+        previous_run = self.state.get("lastTicketsUpdate", 0)
+        return format_timestamp(datetime.datetime.fromtimestamp(previous_run, datetime.timezone.utc))
+
+    def count_updated_tickets(self, token):
+        """Returns the number of tickets updated since the watermark, read by a request of a single ticket"""
+        client = self.get_client(token)
+        params = {"page": 1, "page_size": 1, "updated_at_from": self.updated_since_watermark()}
+        if self.page_cache is not None:
+            params, _ = self.page_cache.first_request("tickets-preflight", params)
+        data = self.fetch_page(client, "tickets", params)
+        count = data.get("count")
+        if count is None:
+            # with a single ticket per page, the number of pages is the number of tickets
+            results = data.get("results", [])
+            count = data.get("total_pages", 1) if results else 0
+        logging.info(f"Tickets updated since the previous run: {count}")
+        return count
+
+    def preflight_page_size(self, count):
+        """Returns the page size of an incremental download of `count` tickets
+
+        Up to DEFAULT_PAGE_SIZE tickets, but no more than the page size of a full load, are read by a single request.
+        More tickets are read in pages of the size of a full load rather than the small incremental default, fetched
+        by up to `page_concurrency` workers.
+        """
+        page_size = self.page_size_for("tickets")
+        if count <= min(DEFAULT_PAGE_SIZE, page_size):
+            return max(1, count)
+        pages = -(-count // page_size)
+        logging.info(f"Downloading {count} tickets in {pages} pages of {page_size} with "
+                     f"{min(self.page_concurrency, pages)} workers")
+        return page_size
+
+    def backfill_tickets(self, token):
+        """Downloads all tickets in windows of their last update, in parallel, and merges them into the output tables
+
+        Each window is written to its own partial tables in a temporary folder. When some windows fail, the completed
+        ones are merged and loaded, they are kept in the state and the next run downloads only the remaining windows.
+        """
+        settings = self.backfill
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        windows = backfill_windows(settings["start"], settings["window_days"], settings["end"])
+        progress = self.state.get(STATE_TICKETS_BACKFILL)
+        if not progress or progress.get("from") != settings["start"].isoformat() \
+                or progress.get("window_days") != settings["window_days"]:
+            progress = {"from": settings["start"].isoformat(), "window_days": settings["window_days"],
+                        "completed": [], "max_updated_at": None}
+        resumed = bool(progress["completed"])
+        pending = [window for window in windows if window_key(window) not in progress["completed"]]
+        logging.info(f"Backfilling tickets in {len(pending)} windows of {settings['window_days']} days "
+                     f"with {settings['workers']} workers")
+        if resumed:
+            logging.info(f"Skipping {len(windows) - len(pending)} windows completed by the previous run")
+
+        max_updated_at = parse_timestamp(progress.get("max_updated_at"))
+        failed = 0
+        with tempfile.TemporaryDirectory(prefix="backfill-", dir=self.data_folder_path) as work_folder:
+            completed_folders = []
+            with ThreadPoolExecutor(max_workers=settings["workers"], thread_name_prefix="backfill") as executor:
+                futures = []
+                for number, window in enumerate(pending):
+                    folder = os.path.join(work_folder, f"window-{number:05d}")
+                    futures.append((window, folder, executor.submit(self.download_window, token, window, folder)))
+                for window, folder, future in futures:
+                    try:
+                        newest = future.result()
+                    except Exception as e:
+                        logging.error(f"Backfill window from {window_key(window)} failed: {str(e)}")
+                        failed += 1
+                        continue
+                    completed_folders.append(folder)
+                    progress["completed"].append(window_key(window))
+                    if newest is not None and (max_updated_at is None or newest > max_updated_at):
+                        max_updated_at = newest
+
+            # with no completed window nothing is written, so the tables in storage are kept
+            if completed_folders:
+                self.merge_backfill(completed_folders, incremental=resumed)
+
+        if failed:
+            progress["max_updated_at"] = max_updated_at.isoformat() if max_updated_at else None
+            self.state[STATE_TICKETS_BACKFILL] = progress
+            raise UserException(f"Backfill of {failed} of {len(pending)} ticket windows failed, the next run "
+                                f"downloads only the windows that failed.")
+        self.state.pop(STATE_TICKETS_BACKFILL, None)
+        self.state.pop(STATE_TICKETS_CHECKPOINT, None)
+        self.update_watermark(max_updated_at or started_at)
+
+    def download_window(self, token, window, folder):
+        """Downloads tickets updated within a backfill window to partial tables in `folder`
+
+        Returns:
+            datetime: The newest `updated_at` of the tickets, None if the window has no tickets
+
+        Raises:
+            UserException: When the API returns tickets updated after the window, i.e. it ignores the upper bound
+        """
+        newest = None
+
+        def records():
+            nonlocal newest
+            for record in self.iter_retino_records(token, "tickets", window=window):
+                newest = max_timestamp((record,), newest)
+                if window[1] is not None and newest is not None and newest >= window[1]:
+                    # without the filter, every window would read all tickets updated since its start
+                    raise UserException(f"The API returned a ticket updated at {newest.isoformat()} for the backfill "
+                                        f"window ending at {window[1].isoformat()}, it does not support the "
+                                        f"'{UPDATED_AT_TO_PARAM}' filter. Disable the backfill.")
+                yield record
+
+        with self.profiler.stage("backfill-window"):
+            self.process_endpoint(records(), "tickets", folder=folder)
+        return newest
+
+    def merge_backfill(self, folders, incremental=False):
+        """Merges partial tables of backfill windows into the output tables and creates their manifests"""
+        schema = SCHEMAS["tickets"]
+        names = [schema.table_name("tickets", table) for table in schema.tables]
+        with self.profiler.stage("backfill-merge"), self.open_tables() as tables:
+            for table, name in zip(schema.tables, names):
+                tables.add_table(name, table.column_names)
+            duplicates = merge_windows(folders, tables, names)
+        if duplicates:
+            logging.info(f"Tickets received in more than one backfill window: {duplicates}, "
+                         f"only their copies from the latest window are written")
+        self.create_manifests(schema, "tickets", tables, incremental)
+
+    def download_cached_endpoint(self, token, endpoint):
+        """Downloads a settings endpoint and processes it only when its data changed since the last run
+
+        The ETag and a hash of the records of each endpoint are kept in the state. The first page is requested
+        with `If-None-Match` when the endpoint had a single page, otherwise all records are downloaded and compared
+        by their hash. Unchanged endpoints write no tables, so nothing is loaded to storage.
+        """
+        cache = self.state.setdefault(STATE_SETTINGS_CACHE, {})
+        cached = cache.get(endpoint, {})
+        if cached.get("version") != SETTINGS_CACHE_VERSION:
+            cached = {}
+
+        client = self.get_client(token)
+        params = {"page": 1, "page_size": self.page_size_for(endpoint)}
+        headers = {"If-None-Match": cached["etag"]} if cached.get("etag") and cached.get("pages") == 1 else None
+        try:
+            response = client.get(endpoint, params, headers=headers)
+        except requests.exceptions.RequestException as e:
+            raise self.network_error(client, endpoint, e)
+        if response.status_code == 304:
+            logging.info(f"Data of endpoint {endpoint} did not change (ETag), skipping")
+            return
+
+        data = client.decode(endpoint, response)
+        records = data.get('results', [])
+        total_pages = data.get('total_pages', 1)
+        if total_pages > 1:
+            for _, results in self.fetch_pages(client, endpoint, {**params, "page": 2}):
+                records.extend(results)
+
+        self.metrics.endpoint(endpoint).add_pages(total_pages)
+        digest = hashlib.sha256(json.dumps(records, sort_keys=True).encode()).hexdigest()
+        entry = {"version": SETTINGS_CACHE_VERSION, "etag": response.headers.get("ETag"), "hash": digest,
+                 "pages": total_pages}
+        if cached.get("hash") == digest:
+            logging.info(f"Data of endpoint {endpoint} did not change, skipping")
+        else:
+            self.process_endpoint(records, endpoint)
+        cache[endpoint] = entry
+
+    def create_manifest(self, csv_file_path, primary_keys, incremental=False, columns=None):
         """Creates a manifest file for a CSV file
 
         Args:
             csv_file_path (str): File path of the CSV file
             primary_keys (dict): List of primary keys
+            columns (list): Columns of a table without a header, e.g. a sliced table
         """
         manifest_path = f"{csv_file_path}.manifest"
         manifest_data = {
             "primary_key": primary_keys,
             "incremental": incremental,
-            "columns": []
+            "columns": columns or []
         }
         with open(manifest_path, 'w') as manifest_file:
             json.dump(manifest_data, manifest_file)
 
-    def get_retino_data(self, token, endpoint, increment=False, page_size=100):
+    def get_retino_data(self, token, endpoint, increment=False, page_size=None):
         """
-        Fetches all pages of data from the Retino API handling pagination and potential network errors gracefully.
+        Fetches all pages of data from the Retino API and returns them as a single list.
+        Prefer `iter_retino_records` for large endpoints, as this keeps the whole endpoint in memory.
         """
-        url = f"https://app.retino.com/api/v2/{endpoint}"
-        headers = {"Authorization": f"Token {token}"}
-        all_data = []
-        current_page = 1
-        params = {"page": current_page, "page_size": page_size}
-
-        # if endpoint is tickets and incremental update is enabled, add last update timestamp to params
-        if endpoint == "tickets" and increment:
-            previous_state = self.get_state_file()
-            previous_run = previous_state.get("lastTicketsUpdate", 0)
-            previous_run = datetime.datetime.fromtimestamp(previous_run, datetime.timezone.utc)
-            previous_run = previous_run.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            params["updated_at_from"] = previous_run
-            params["page_size"] = 10
+        return list(self.iter_retino_records(token, endpoint, increment, page_size))
 
-        while True:
+    def iter_retino_records(self, token, endpoint, increment=False, page_size=None, window=None):
+        """
+        Yields records from the Retino API one by one. Up to `pipeline_pages` pages are fetched ahead of the consumer,
+        without the pipeline the next page is fetched only when the previous one is consumed.
+        """
+        # streamed pages are decoded while they are consumed, so they cannot be fetched ahead
+        streamed = self.streaming_decode and self.page_concurrency == 1 and self.adaptive_page_size is None
+        pages = self.iter_retino_pages(token, endpoint, increment, page_size, window,
+                                       pipeline=bool(self.pipeline_pages) and not streamed)
+        try:
+            for page in pages:
+                yield from page
+        finally:
+            # stops fetching ahead when the records are not consumed to the end
+            pages.close()
+
+    def pipelined(self, steps, endpoint):
+        """Fetches pages in a producer thread through a queue of at most `pipeline_pages` pages
+
+        `steps` are the steps of a download from `iter_page_steps`. Each page is queued together with the step
+        following it, which records the page as written in the state, so the consumer runs the step only after it
+        wrote the page. The consumer writes a page while the next ones are being fetched, and a full queue stops
+        the fetching until the consumer catches up. An error of the download is raised to the consumer after all
+        pages fetched before it, so an incomplete download writes every page covered by its checkpoint. When the
+        consumer stops early, the producer stops after the page being fetched.
+
+        The producer is profiled as the `{endpoint}-fetch` stage.
+        """
+        buffer = queue.Queue(maxsize=self.pipeline_pages)
+        stopped = threading.Event()
+        end = object()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    buffer.put(item, timeout=PIPELINE_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fetch():
+            """Queues the pages, returns the last item to queue, or None when the consumer stopped"""
+            page = None
             try:
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()  # Raises an HTTPError for bad responses
-                data = response.json()
-                all_data.extend(data.get('results', []))
-                if current_page >= data.get('total_pages', 1):
-                    break
-                if current_page == 1:
-                    logging.info(f"Total pages to process: {data.get('total_pages', 1)}")
-                if LOCALHOST_MODE:
-                    logging.info("Stopping after first page in localhost mode")
-                    break
-                current_page += 1
-                params["page"] = current_page
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Network error when fetching data from {url}: {str(e)}")
-                raise UserException(f"Failed to fetch data due to a network error: {str(e)}")
-
-        # if endpoint was tickets, save current timestamp for incremental updates
-        # 2 hours are subtracted to account for potential timezone differences
-        if endpoint == "tickets":
-            self.write_state_file({"lastTicketsUpdate":
-                                   int((datetime.datetime.now() - datetime.timedelta(hours=2)).timestamp())})
+                for step_page, commit in steps:
+                    if step_page is not None:
+                        # the page is queued with the step that follows it
+                        page = step_page
+                        continue
+                    if not put((page, commit, None)):
+                        steps.close()
+                        return None
+                    page = None
+            except Exception as e:
+                return None, None, e
+            return end, None, None
+
+        def produce():
+            # the stage ends before the last item is queued, so it is complete once the consumer finishes
+            with self.profiler.stage(f"{endpoint}-fetch"):
+                last = fetch()
+            if last is not None:
+                put(last)
+
+        threading.Thread(target=produce, name="pipeline", daemon=True).start()
+        try:
+            while True:
+                page, commit, error = buffer.get()
+                if error is not None:
+                    raise error
+                if page is end:
+                    return
+                yield page, commit
+        finally:
+            stopped.set()
+
+    def iter_retino_pages(self, token, endpoint, increment=False, page_size=None, window=None, pipeline=False):
+        """
+        Fetches pages of data from the Retino API one at a time handling pagination and potential network errors
+        gracefully. Each page is yielded as a list of records, so peak memory depends on the page size only.
 
-        return all_data
+        For tickets, the number of records already written is kept as a checkpoint in the state, a page counts as
+        written once the consumer asks for the next one. When a page fails, IncompleteDownloadError is raised and
+        the next run continues from the checkpoint. Once all pages are written, the watermark is updated.
 
-    def process_refund_accounts(self, data, endpoint):
-        """Processes data from specific endpoint and saves it to CSV files
+        With streaming decoding, each page is yielded as an iterator of records decoded from the response stream,
+        which has to be consumed before the next page is requested.
 
         Args:
-            data (dict): The data to be sent to the endpoint
-            endpoint (str): The URL of the endpoint
+            window (tuple): (from, to) datetimes of a backfill window, only tickets updated within it are fetched,
+                without a checkpoint or a watermark. `to` is None for the last window
+            pipeline (bool): Whether pages are fetched ahead of the consumer, see `pipelined`
         """
-        output_path = os.path.join(self.data_folder, f'{endpoint}.csv')
-
-        # Opening the CSV file
-        with open(output_path, 'w', newline='') as file:
-            writer = csv.writer(file)
-            # Write the header row
-            writer.writerow(['id', 'name', 'bank_account', 'currency', 'due_date'])
-
-            # Iterate over the results and write each row
-            for account in data:
-                writer.writerow([
-                    account['id'],
-                    account['name'],
-                    account['bank_account'],
-                    account['currency'],
-                    account['due_date']
-                ])
-
-        # Generate a manifest file for the CSV
-        self.create_manifest(output_path, ['id'])
-
-    def process_states(self, data, endpoint):
-        """Processes data from specific endpoint and saves it to CSV files
-
-        Args:
-            data (dict): The data to be sent to the endpoint
-            endpoint (str): The URL of the endpoint
+        steps = self.iter_page_steps(token, endpoint, increment, page_size, window)
+        if pipeline:
+            steps = self.pipelined(steps, endpoint)
+        try:
+            for page, commit in steps:
+                if page is not None:
+                    yield page
+                if commit is not None:
+                    commit()
+        finally:
+            steps.close()
+
+    def iter_page_steps(self, token, endpoint, increment=False, page_size=None, window=None):
         """
-        states_output_path = os.path.join(self.data_folder, f'{endpoint}.csv')
-        names_output_path = os.path.join(self.data_folder, f'{endpoint}_names.csv')
-
-        # Handling states file
-        with open(states_output_path, 'w', newline='') as states_file:
-            state_writer = csv.writer(states_file)
-            state_writer.writerow(['id'])
-
-            for state in data:
-                state_writer.writerow([state['id']])
-
-        # Handling names file
-        with open(names_output_path, 'w', newline='') as names_file:
-            name_writer = csv.writer(names_file)
-            name_writer.writerow(['state_id', 'language_code', 'name'])
-
-            for state in data:
-                for lang, name in state.get('name', {}).items():
-                    name_writer.writerow([state['id'], lang, name])
-
-        # Generate manifest files for each CSV
-        self.create_manifest(states_output_path, ['id'])
-        self.create_manifest(names_output_path, ['state_id', 'language_code'])
-
-    def process_tags(self, data, endpoint):
-        """Processes data from specific endpoint and saves it to CSV files
-
-        Args:
-            data (dict): The data to be sent to the endpoint
-            endpoint (str): The URL of the endpoint
+        Yields the steps of a download: `(page, None)` for each fetched page, followed by `(None, commit)`, where
+        `commit` records the page as written in the state (None without a checkpoint), and finally `(None, finish)`
+        finishing the download of tickets in the state. The steps changing the state are run by the consumer.
         """
-        tags_output_path = os.path.join(self.data_folder, f'{endpoint}.csv')
-        names_output_path = os.path.join(self.data_folder, f'{endpoint}_names.csv')
-
-        # Handling tags file
-        with open(tags_output_path, 'w', newline='') as tags_file:
-            tag_writer = csv.writer(tags_file)
-            tag_writer.writerow(['id', 'fgcolor', 'bgcolor'])
-
-            for tag in data:
-                tag_writer.writerow([tag['id'], tag['fgcolor'], tag['bgcolor']])
-
-        # Handling names file
-        with open(names_output_path, 'w', newline='') as names_file:
-            name_writer = csv.writer(names_file)
-            name_writer.writerow(['tag_id', 'language_code', 'name'])
-
-            for tag in data:
-                for lang, name in tag['name'].items():
-                    name_writer.writerow([tag['id'], lang, name])
+        client = self.get_client(token)
+        params = {"page": 1, "page_size": page_size or self.page_size_for(endpoint, increment)}
+
+        # a single download of tickets keeps the checkpoint and the watermark, windows of a backfill do not
+        checkpointed = endpoint == "tickets" and window is None
+
+        # tickets of a backfill window or of an incremental update are filtered by their last update
+        if window is not None:
+            params["updated_at_from"] = format_timestamp(window[0])
+            if window[1] is not None:
+                params[UPDATED_AT_TO_PARAM] = format_timestamp(window[1])
+        elif endpoint == "tickets" and increment:
+            params["updated_at_from"] = self.updated_since_watermark()
+
+        offset = 0
+        checkpoint = self.tickets_checkpoint(increment) if checkpointed else None
+        if checkpoint:
+            offset = checkpoint["offset"]
+            params["page_size"] = checkpoint["page_size"]
+            params["page"] = offset // params["page_size"] + 1
+            logging.info(f"Resuming download of {endpoint} after {offset} records from the previous run")
+        if self.page_cache is not None:
+            # a replay starts where the recorded download started, whatever the state
+            download = endpoint if window is None else f"{endpoint}-{window_key(window)}"
+            params, offset = self.page_cache.first_request(download, params, offset)
+
+        if self.adaptive_page_size is not None and self.page_concurrency == 1:
+            pages = self.fetch_pages_adaptive(client, endpoint, params, offset)
+        elif self.streaming_decode and self.page_concurrency == 1:
+            pages = self.fetch_pages_streamed(client, endpoint, params)
+        else:
+            pages = self.fetch_pages(client, endpoint, params)
+
+        # the watermark is taken from the data, the start of the download is used only when tickets have no timestamp
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        max_updated_at = parse_timestamp(checkpoint.get("max_updated_at")) if checkpoint else None
+
+        metrics = self.metrics.endpoint(endpoint)
+        completed = 0
+        records = 0
+
+        def incomplete_download(error):
+            # pages already written are kept and the next run resumes after them, tickets only
+            if checkpointed and completed:
+                return IncompleteDownloadError(f"{str(error)} The download will resume after {offset} records "
+                                               f"in the next run.")
+            return None
+
+        def streamed_records(results):
+            # the page is decoded while it is consumed, so its errors are raised to the consumer
+            nonlocal max_updated_at, records
+            try:
+                for record in results:
+                    if checkpointed:
+                        max_updated_at = max_timestamp((record,), max_updated_at)
+                        records += 1
+                    yield record
+            except UserException as e:
+                error = incomplete_download(e)
+                if error is None:
+                    raise
+                raise error from e
+
+        try:
+            for page_size, results in pages:
+                if checkpoint and not completed and isinstance(results, list) and not results:
+                    raise StaleCheckpointError(f"The download of {endpoint} cannot resume after {offset} records, "
+                                               f"the page is out of range.")
+                metrics.add_pages()
+                if not isinstance(results, list):
+                    yield streamed_records(results), None
+                else:
+                    if checkpointed:
+                        max_updated_at = max_timestamp(results, max_updated_at)
+                        records += len(results)
+                    yield results, None
+                offset += page_size
+                completed += 1
+                commit = None
+                if checkpointed:
+                    commit = functools.partial(self.state.__setitem__, STATE_TICKETS_CHECKPOINT, {
+                        "offset": offset, "page_size": page_size, "updated_at_from": params.get("updated_at_from"),
+                        "max_updated_at": max_updated_at.isoformat() if max_updated_at else None})
+                yield None, commit
+        except StaleCheckpointError:
+            raise
+        except UserException as e:
+            if checkpoint and not completed and self.error_status(e) == 404:
+                raise StaleCheckpointError(f"The download of {endpoint} cannot resume after {offset} records, "
+                                           f"the page was not found.") from e
+            error = incomplete_download(e)
+            if error is None:
+                raise
+            raise error from e
+
+        if checkpointed:
+            if max_updated_at is None and (records or not increment):
+                max_updated_at = started_at
+            yield None, functools.partial(self.finish_tickets_download, max_updated_at, increment)
+
+    def finish_tickets_download(self, max_updated_at, increment=False):
+        """Removes the checkpoint of a completed download of tickets and updates the watermark"""
+        self.state.pop(STATE_TICKETS_CHECKPOINT, None)
+        # save the newest update seen for incremental updates, a small overlap is subtracted
+        # to catch tickets updated while the previous run was paginating
+        self.update_watermark(max_updated_at, increment)
+
+    def update_watermark(self, max_updated_at, increment=False):
+        """Stores the newest ticket update minus the overlap as the watermark of the next incremental run
+
+        An incremental run never moves the watermark back.
+        """
+        if max_updated_at is None:
+            return
+        watermark = max_updated_at - datetime.timedelta(minutes=self.watermark_overlap)
+        previous_watermark = self.state.get("lastTicketsUpdate", 0) if increment else 0
+        self.state["lastTicketsUpdate"] = max(int(watermark.timestamp()), previous_watermark)
+
+    def tickets_checkpoint(self, increment=False):
+        """Returns the checkpoint of an unfinished tickets download, if it was made with the same filter"""
+        checkpoint = self.state.get(STATE_TICKETS_CHECKPOINT)
+        if not checkpoint or checkpoint.get("updated_at_from") != (
+                self.updated_since_watermark() if increment else None):
+            return None
+        return checkpoint
+
+    def fetch_pages(self, client, endpoint, params):
+        """Fetches all pages with the page size from `params`, in parallel when `page_concurrency` is set
+
+        Yields:
+            tuple: (page_size, results) of each page
+        """
+        page_size = params["page_size"]
+        first_page = params["page"]
+        data = self.fetch_page(client, endpoint, params)
+        total_pages = data.get('total_pages', 1)
+        yield page_size, data.get('results', [])
+
+        if total_pages > first_page:
+            logging.info(f"Total pages to process: {total_pages}")
+            if LOCALHOST_MODE:
+                logging.info("Stopping after first page in localhost mode")
+                total_pages = first_page
+
+        remaining_pages = range(first_page + 1, total_pages + 1)
+        if self.page_concurrency > 1 and len(remaining_pages):
+            for results in self.fetch_pages_parallel(client, endpoint, params, remaining_pages):
+                yield page_size, results
+        else:
+            for current_page in remaining_pages:
+                yield page_size, self.fetch_page(client, endpoint, {**params, "page": current_page}).get('results', [])
+
+    def fetch_pages_streamed(self, client, endpoint, params):
+        """Fetches all pages one by one and decodes their records from the response stream
+
+        The records of a page are yielded as an iterator, so they are written while the page is being received.
+        The iterator has to be consumed before the next page is requested, as `total_pages` is read from the stream.
+
+        Yields:
+            tuple: (page_size, records) of each page
+        """
+        page_size = params["page_size"]
+        page = params["page"]
+        total_pages = page
+        while page <= total_pages:
+            try:
+                response = client.get(endpoint, {**params, "page": page}, stream=True)
+            except requests.exceptions.RequestException as e:
+                raise self.network_error(client, endpoint, e)
+            with response:
+                streamed = decoding.StreamedPage(response)
+                yield page_size, self.iter_streamed_page(client, endpoint, streamed)
+            total_pages = streamed.total_pages or 1
+            if page == params["page"] and total_pages > page:
+                logging.info(f"Total pages to process: {total_pages}")
+                if LOCALHOST_MODE:
+                    logging.info("Stopping after first page in localhost mode")
+                    break
+            page += 1
+
+    def iter_streamed_page(self, client, endpoint, streamed):
+        """Yields records of a streamed page, measuring the decoding time and translating network errors"""
+        metrics = self.metrics.endpoint(endpoint)
+        records = iter(streamed)
+        decode_time = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    record = next(records)
+                except StopIteration:
+                    break
+                finally:
+                    decode_time += time.perf_counter() - started
+                yield record
+        except requests.exceptions.RequestException as e:
+            raise self.network_error(client, endpoint, e)
+        finally:
+            metrics.add_stage_time("decode", decode_time)
 
-        # Generate manifest files for each CSV
-        self.create_manifest(tags_output_path, ['id'])
-        self.create_manifest(names_output_path, ['tag_id', 'language_code'])
+    def fetch_pages_adaptive(self, client, endpoint, params, offset=0):
+        """Fetches all pages one by one, adapting the page size to response times and payload sizes
 
-    def process_types(self, data, endpoint):
-        """Processes data from specific endpoint and saves it to CSV files
+        The page size from `params` is the initial one. Timeouts and 5xx errors shrink the page and the same records
+        are requested again with the smaller size. They are retried by the client only once the page cannot shrink.
 
         Args:
-            data (dict): The data to be sent to the endpoint
-            endpoint (str): The URL of the endpoint
-        """
-        types_output_path = os.path.join(self.data_folder, f'{endpoint}.csv')
-        names_output_path = os.path.join(self.data_folder, f'{endpoint}_names.csv')
+            offset (int): Number of records already read
 
-        # Handling types file
-        with open(types_output_path, 'w', newline='') as types_file:
-            type_writer = csv.writer(types_file)
-            type_writer.writerow(['id', 'name'])
+        Yields:
+            tuple: (page_size, results) of each page
+        """
+        sizer = AdaptivePageSize(params["page_size"], **self.adaptive_page_size)
+        first_offset = offset
+        while True:
+            page, page_size = sizer.next_page(offset)
+            started = time.perf_counter()
+            try:
+                response = client.get(endpoint, {**params, "page": page, "page_size": page_size},
+                                      fail_fast=sizer.can_shrink)
+                data = client.decode(endpoint, response)
+            except (requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+                server_error = e.response is None or e.response.status_code >= 500
+                if server_error and sizer.can_shrink:
+                    sizer.record_failure(str(e))
+                    continue
+                raise self.network_error(client, endpoint, e)
+            except requests.exceptions.RequestException as e:
+                raise self.network_error(client, endpoint, e)
+            sizer.record_success(time.perf_counter() - started, len(response.content))
+
+            yield page_size, data.get('results', [])
+            offset += page_size
+            total_pages = data.get('total_pages', 1)
+            if page >= total_pages:
+                break
+            if offset == first_offset + page_size:
+                logging.info(f"Total pages to process: {total_pages} (page size {page_size}, adaptive)")
+            if LOCALHOST_MODE:
+                logging.info("Stopping after first page in localhost mode")
+                break
+
+    def page_size_for(self, endpoint, increment=False):
+        """Returns the configured page size of an endpoint
+
+        The `page_size` parameter is either a single number used for all endpoints, or an object
+        with page sizes of individual endpoints, e.g. `{"tickets": 50, "default": 100}`.
+        """
+        page_sizes = self.page_sizes if isinstance(self.page_sizes, dict) else {"default": self.page_sizes}
+        if endpoint in page_sizes:
+            return int(page_sizes[endpoint])
+        if endpoint == "tickets" and increment:
+            return DEFAULT_INCREMENTAL_PAGE_SIZE
+        return int(page_sizes.get("default", DEFAULT_PAGE_SIZE))
+
+    def get_client(self, token):
+        """Returns the Retino API client shared by all endpoints, creating it on first use"""
+        with self.client_lock:
+            if self.client is None:
+                workers = self.endpoint_concurrency + (self.backfill["workers"] if self.backfill else 0)
+                self.client = RetinoClient(token, base_url=self.api_base_url, max_retries=self.max_retries,
+                                           pool_size=max(10, self.page_concurrency * workers),
+                                           metrics=self.metrics, rate_limiter=RateLimiter(**self.rate_limit),
+                                           page_cache=self.page_cache)
+            return self.client
+
+    def get_process_pool(self):
+        """Returns the pool of processes flattening tickets, shared by all endpoints and backfill windows"""
+        with self.process_pool_lock:
+            if self.process_pool is None:
+                # spawned workers do not inherit locks held by other threads of the component
+                self.process_pool = ProcessPoolExecutor(self.flatten_processes,
+                                                        mp_context=multiprocessing.get_context("spawn"))
+            return self.process_pool
+
+    def fetch_page(self, client, endpoint, params):
+        """Fetches a single page from the Retino API
+
+        Transient errors are retried by the client, so only the failing page is requested again.
 
-            for type_ in data:
-                # Selecting name based on language preference
-                name = self.select_name_by_preference(type_['name'])
-                type_writer.writerow([type_['id'], name])
+        Returns:
+            dict: The decoded response
+        """
+        try:
+            return client.get_json(endpoint, params)
+        except requests.exceptions.RequestException as e:
+            raise self.network_error(client, endpoint, e)
 
-        # Handling names file
-        with open(names_output_path, 'w', newline='') as names_file:
-            name_writer = csv.writer(names_file)
-            name_writer.writerow(['type_id', 'language_code', 'name'])
+    @staticmethod
+    def error_status(error):
+        """Returns the HTTP status of the failed request behind a network error, None if there is none"""
+        response = getattr(error.__cause__ or error.__context__, "response", None)
+        return getattr(response, "status_code", None)
 
-            for type_ in data:
-                if 'name' in type_:
-                    for lang, name in type_['name'].items():
-                        name_writer.writerow([type_['id'], lang, name])
+    @staticmethod
+    def network_error(client, endpoint, e):
+        """Logs a failed request and returns the UserException to be raised"""
+        logging.error(f"Network error when fetching data from {client.endpoint_url(endpoint)}: {str(e)}")
+        return UserException(f"Failed to fetch data due to a network error: {str(e)}")
 
-        # Generate manifest files for each CSV
-        self.create_manifest(types_output_path, ['id'])
-        self.create_manifest(names_output_path, ['type_id', 'language_code'])
+    def fetch_pages_parallel(self, client, endpoint, params, pages):
+        """Fetches pages concurrently with `page_concurrency` workers and yields their results in page order
 
-    def select_name_by_preference(self, names, lang="en"):
-        """Settles the name based on the preferred language order
+        At most `page_concurrency` pages are requested ahead of the page being consumed, so memory stays bounded
+        by the number of workers.
 
         Args:
-            names (dict): The names in different languages
+            pages (iterable): Page numbers to fetch
+        """
+        pages = iter(pages)
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=self.page_concurrency) as executor:
+            try:
+                for page in itertools.islice(pages, self.page_concurrency):
+                    pending.append(executor.submit(self.fetch_page, client, endpoint, {**params, "page": page}))
+                while pending:
+                    data = pending.popleft().result()
+                    for page in itertools.islice(pages, 1):
+                        pending.append(executor.submit(self.fetch_page, client, endpoint, {**params, "page": page}))
+                    yield data.get('results', [])
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def open_tables(self, folder=None):
+        """Returns a TableWriterSet for output tables, configured by the `output_slicing` parameter
+
+        Partial tables written to another `folder` are never sliced.
+        """
+        if folder is not None:
+            return TableWriterSet(folder, self.write_buffer_size)
+        slicing = self.output_slicing
+        if not slicing:
+            return TableWriterSet(self.data_folder, self.write_buffer_size)
+        return TableWriterSet(self.data_folder, self.write_buffer_size,
+                              slice_rows=int(slicing.get("slice_rows", DEFAULT_SLICE_ROWS)),
+                              compress=bool(slicing.get("compress", True)),
+                              sliced_tables=slicing.get("tables", DEFAULT_SLICED_TABLES))
+
+    def create_manifests(self, schema, endpoint, tables, incremental=False):
+        """Creates manifests of all tables of an endpoint, sliced tables have no header so their columns are listed"""
+        with self.profiler.stage("manifests"):
+            for table in schema.tables:
+                name = schema.table_name(endpoint, table)
+                self.create_manifest(tables.paths[name], table.primary_key, incremental=incremental,
+                                     columns=table.column_names if name in tables.sliced else None)
+
+    @staticmethod
+    def replace_duplicates(tables, flattener, index):
+        """Replaces the rows of records received more than once by the rows of their latest copies
+
+        The latest copies kept in the index are written at the end of the tables, which are then closed and
+        rewritten without the rows of the earlier copies. The first column of every table is the record id.
 
         Returns:
-            str: The name in the preferred language
+            dict: Change of the number of rows of each table
         """
-
-        # Language preference order
-        preferred_languages = [lang, 'en', 'cs']
-        for lang in preferred_languages:
-            if lang in names:
-                return names[lang]
-
-        # Fallback: If no preferred language is available, use the first available translation
-        first_key = list(names.keys())[0]
-        return f"{names[first_key]} ({first_key})"
-
-    def process_users(self, data, endpoint):
-        """Processes data from specific endpoint and saves it to CSV files
+        written = dict(flattener.rows)
+        for record in index.pending.values():
+            flattener.write(record)
+        tables.close()
+
+        replaced = index.replaced_ids()
+        changes = {}
+        for name, rows in written.items():
+            removed = tables.filter_rows(name, lambda row_index, row: row_index >= rows or row[0] not in replaced)
+            changes[name] = flattener.rows[name] - rows - removed
+        logging.info(f"Tickets received more than once: {index.duplicates} duplicates of {len(index.pending)} "
+                     f"tickets, only their latest copies are written")
+        return changes
+
+    def process_endpoint(self, data, endpoint, incremental=False, folder=None):
+        """Flattens records of an endpoint to its output tables and creates their manifests
+
+        All tables declared in the endpoint schema are written in a single pass over the records, through files
+        kept open until the last record is written. When the download fails after some pages were written,
+        the tables are kept with their manifests, so they are loaded to storage and the next run can resume
+        after them. When writing fails, the tables are removed and the checkpoint and the watermark of tickets
+        are restored to their values from before the download.
+
+        Tickets received more than once in the run are written once, the latest copy wins. With
+        `flatten_processes`, tickets are flattened in batches by worker processes, see `flatten_in_processes`.
 
         Args:
-            data (dict): The data to be sent to the endpoint
+            data (iterable): The records to be processed
             endpoint (str): The URL of the endpoint
+            incremental (bool): Whether the tables are loaded incrementally
+            folder (str): Folder of partial tables written without manifests, e.g. of a backfill window
+        """
+        schema = SCHEMAS[endpoint]
+        metrics = self.metrics.endpoint(endpoint)
+        index = RecordIndex() if endpoint == "tickets" and self.deduplicate_tickets else None
+        incomplete = None
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+        # the checkpoint and the watermark of a single download of tickets cover only tables that are loaded
+        progress = {key: self.state.get(key) for key in TICKETS_PROGRESS_STATE} \
+            if endpoint == "tickets" and folder is None else None
+        try:
+            with self.open_tables(folder) as tables:
+                flattener = Flattener(schema, endpoint, tables)
+                write_time = 0.0
+                try:
+                    if endpoint == "tickets" and self.flatten_processes:
+                        records = data if index is None else (record for record in data if index.add(record))
+                        write_time = self.flatten_in_processes(records, flattener)
+                    else:
+                        for record in data:
+                            started = time.perf_counter()
+                            if index is None or index.add(record):
+                                flattener.write(record)
+                            write_time += time.perf_counter() - started
+                except IncompleteDownloadError as e:
+                    # pages written so far are kept and loaded, the next run resumes after them
+                    incomplete = e
+                finally:
+                    if hasattr(data, "close"):
+                        # after a failed write, the download stops fetching pages ahead
+                        data.close()
+                    metrics.add_stage_time("write", write_time)
+                    metrics.add_rows(flattener.rows)
+
+                if index is not None and index.pending:
+                    with metrics.stage("write"):
+                        metrics.add_rows(self.replace_duplicates(tables, flattener, index))
+
+            if folder is None:
+                self.create_manifests(schema, endpoint, tables, incremental)
+        except Exception:
+            if progress is not None:
+                # the tables are discarded, so the next run starts from where this run started
+                self.restore_state(progress)
+            raise
+
+        if incomplete:
+            raise incomplete
+
+    def restore_state(self, values):
+        """Sets keys of the state back to the given values, None values are removed"""
+        for key, value in values.items():
+            if value is None:
+                self.state.pop(key, None)
+            else:
+                self.state[key] = value
+
+    def flatten_in_processes(self, records, flattener):
+        """Flattens records in batches by the worker processes and appends their CSV chunks in the record order
+
+        Batches are submitted while the next records are being downloaded, at most a few per process are queued.
+        When the download fails, the batches already received are still written, as the checkpoint of the
+        download covers them.
+
+        Returns:
+            float: Seconds spent waiting for and writing the chunks
         """
-        users_output_path = os.path.join(self.data_folder, f'{endpoint}.csv')
-
-        # Handling users file
-        with open(users_output_path, 'w', newline='') as users_file:
-            user_writer = csv.writer(users_file)
-            user_writer.writerow(['id', 'role', 'email', 'full_name',
-                                  'phone_number', 'last_activity_at', 'date_joined'])
-
-            for user in data:
-                user_writer.writerow([
-                    user['id'],
-                    user['role'],
-                    user['email'],
-                    user['full_name'],
-                    user['phone_number'],
-                    user['last_activity_at'],
-                    user['date_joined']
-                ])
-
-        # Generate manifest file for the CSV
-        self.create_manifest(users_output_path, ['id'])
-
-    def process_tickets(self, data, endpoint, incremental):
-        tickets_output_path = os.path.join(self.data_folder, f'{endpoint}.csv')
-        bound_orders_output_path = os.path.join(self.data_folder, f'{endpoint}_bound_orders.csv')
-        products_output_path = os.path.join(self.data_folder, f'{endpoint}_products.csv')
-        history_output_path = os.path.join(self.data_folder, f'{endpoint}_history.csv')
-
-        with open(tickets_output_path, 'w', newline='') as file:
-            ticket_writer = csv.writer(file)
-            ticket_writer.writerow(['id', 'company', 'code', 'state', 'type', 'owner'])
-
-        with open(bound_orders_output_path, 'w', newline='') as file:
-            order_writer = csv.writer(file)
-            order_writer.writerow(['ticket_id', 'id', 'code', 'remote_id', 'order_date', 'currency'])
-
-        with open(products_output_path, 'w', newline='') as file:
-            product_writer = csv.writer(file)
-            product_writer.writerow(['ticket_id', 'id', 'bound_order_item', 'price_with_vat', 'name', 'manufacturer'])
-
-        with open(history_output_path, 'w', newline='') as file:
-            history_writer = csv.writer(file)
-            history_writer.writerow(['ticket_id', 'id', 'history_item_type', 'text'])
-
-        for ticket in data:
-            with open(tickets_output_path, 'a', newline='') as file:
-                ticket_writer = csv.writer(file)
-                ticket_writer.writerow([ticket['id'], ticket['company'], ticket['code'],
-                                        ticket['state'], ticket['type'], ticket['owner']])
-
-            with open(bound_orders_output_path, 'a', newline='') as file:
-                order_writer = csv.writer(file)
-                order = ticket['bound_order']
-                order_writer.writerow([ticket['id'], order['id'], order['code'],
-                                       order['remote_id'], order['order_date'], order['currency']])
-
-            with open(products_output_path, 'a', newline='') as file:
-                product_writer = csv.writer(file)
-                for product in ticket['products']:
-                    product_writer.writerow([ticket['id'], product['id'], product['bound_order_item'],
-                                             product['price']['with_vat'], product['name'], product['manufacturer']])
-
-            with open(history_output_path, 'a', newline='') as file:
-                history_writer = csv.writer(file)
-                for history_item in ticket['history_items']:
-                    history_writer.writerow([ticket['id'], history_item['id'], history_item['history_item_type'],
-                                             history_item['history_item_data'].get('text', '')])
-
-        # Generate manifest files
-        self.create_manifest(tickets_output_path, ['id'], incremental=incremental)
-        self.create_manifest(bound_orders_output_path, ['ticket_id', 'id'], incremental=incremental)
-        self.create_manifest(products_output_path, ['ticket_id', 'id'], incremental=incremental)
-        self.create_manifest(history_output_path, ['ticket_id', 'id'], incremental=incremental)
+        pool = self.get_process_pool()
+        endpoint = flattener.endpoint
+        max_pending = self.flatten_processes * FLATTEN_BATCHES_PER_PROCESS
+        pending = collections.deque()
+        batch = []
+        write_time = 0.0
+
+        def write_batches(keep):
+            nonlocal write_time
+            while len(pending) > keep:
+                started = time.perf_counter()
+                flattener.write_chunks(pending.popleft().result())
+                write_time += time.perf_counter() - started
+
+        try:
+            for record in records:
+                batch.append(record)
+                if len(batch) >= FLATTEN_BATCH_SIZE:
+                    pending.append(pool.submit(flatten_to_csv, endpoint, batch))
+                    batch = []
+                    write_batches(max_pending)
+        except IncompleteDownloadError:
+            if batch:
+                pending.append(pool.submit(flatten_to_csv, endpoint, batch))
+            write_batches(0)
+            raise
+        if batch:
+            pending.append(pool.submit(flatten_to_csv, endpoint, batch))
+        write_batches(0)
+        return write_time
 
 
 """
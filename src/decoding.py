@@ -0,0 +1,101 @@
+"""
+Decoding of JSON responses of the Retino API.
+
+Whole responses are decoded by orjson when it is installed, which is several times faster than the standard
+library. `StreamedPage` decodes the records of a page one by one from the response stream with ijson, so rows
+are written while the page is still being received and the page is never held in memory as a whole.
+Both libraries are optional, `STREAMING_AVAILABLE` tells whether ijson is installed.
+"""
+import json
+
+import requests
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+STREAMING_AVAILABLE = ijson is not None
+
+# size of the chunks read from a streamed response in bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def loads(content):
+    """Decodes a JSON document from bytes with the fastest available library"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def decode_response(response):
+    """Returns the decoded JSON body of a response
+
+    Raises:
+        requests.exceptions.InvalidJSONError: When the body is not a valid JSON
+    """
+    try:
+        return loads(response.content)
+    except ValueError as e:
+        raise requests.exceptions.InvalidJSONError(f"Invalid JSON in the response: {str(e)}",
+                                                   response=response) from e
+
+
+class StreamedPage:
+    """
+    A page of an endpoint decoded from a streamed response (`stream=True`) record by record.
+
+    Usage:
+
+        page = StreamedPage(response)
+        for record in page:
+            ...
+        total_pages = page.total_pages
+
+    The records can be iterated only once. `total_pages` is read from the response stream as well,
+    it is set once the records are iterated.
+
+    Raises:
+        requests.exceptions.RequestException: While iterating, when the stream fails or is not a valid JSON
+    """
+
+    def __init__(self, response, chunk_size=STREAM_CHUNK_SIZE):
+        if ijson is None:
+            raise RuntimeError("Streaming decoding requires the ijson library")
+        self.response = response
+        self.chunk_size = chunk_size
+        self.total_pages = None
+        self.records = 0
+
+    def __iter__(self):
+        records = ijson.sendable_list()
+        total_pages = ijson.sendable_list()
+        # floats are decoded as floats, not decimals, so the output matches the whole page decoding
+        records_parser = ijson.items_coro(records, 'results.item', use_float=True)
+        # the API sends `total_pages` before the results, so its parser usually stops after the first chunk
+        total_pages_parser = ijson.items_coro(total_pages, 'total_pages')
+        try:
+            for chunk in self.response.iter_content(self.chunk_size):
+                records_parser.send(chunk)
+                if self.total_pages is None:
+                    total_pages_parser.send(chunk)
+                    if total_pages:
+                        self.total_pages = total_pages[0]
+                if records:
+                    self.records += len(records)
+                    yield from records
+                    del records[:]
+            records_parser.close()
+            if self.total_pages is None:
+                total_pages_parser.close()
+                self.total_pages = total_pages[0] if total_pages else None
+        except ijson.JSONError as e:
+            raise requests.exceptions.InvalidJSONError(f"Invalid JSON in the response: {str(e)}",
+                                                       response=self.response) from e
+        yield from records
+        self.records += len(records)
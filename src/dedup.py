@@ -0,0 +1,78 @@
+"""
+Deduplication of records received more than once in a run.
+
+With `updated_at_from` pagination, a ticket updated while the pages are being read moves between pages,
+so it can be received twice. `RecordIndex` remembers the ids of written records in a compact bitmap
+(a bit per id, 1.25 MB per 10 million ids) and keeps only the latest copy of each duplicate, which replaces
+the rows written for its earlier copy once the endpoint is read.
+"""
+
+# ids over this limit are kept in a set instead of the bitmap, so a single huge id cannot allocate a huge bitmap
+MAX_BITMAP_ID = 1 << 30
+
+
+class RecordIndex:
+    """
+    Index of records written in a run, keyed by their id. Later copies of a record win.
+
+    Usage:
+
+        index = RecordIndex()
+        for record in records:
+            if index.add(record):
+                write(record)
+        for record in index.pending.values():
+            replace(record)
+    """
+
+    def __init__(self, key='id'):
+        self.key = key
+        # records received again after their first copy was written, by id
+        self.pending = {}
+        self.duplicates = 0
+        self._bitmap = bytearray()
+        self._ids = set()
+
+    def __contains__(self, record_id):
+        if isinstance(record_id, int) and 0 <= record_id < MAX_BITMAP_ID:
+            byte = record_id >> 3
+            return byte < len(self._bitmap) and bool(self._bitmap[byte] & (1 << (record_id & 7)))
+        return record_id in self._ids
+
+    def _mark(self, record_id):
+        if isinstance(record_id, int) and 0 <= record_id < MAX_BITMAP_ID:
+            byte = record_id >> 3
+            if byte >= len(self._bitmap):
+                # grow geometrically, so sequential ids do not reallocate the bitmap for every new byte
+                self._bitmap.extend(bytes(max(byte + 1 - len(self._bitmap), len(self._bitmap))))
+            self._bitmap[byte] |= 1 << (record_id & 7)
+        else:
+            self._ids.add(record_id)
+
+    def add_id(self, record_id):
+        """Adds an id to the index
+
+        Returns:
+            bool: True when the id is new, False when it is already in the index
+        """
+        if record_id in self:
+            return False
+        self._mark(record_id)
+        return True
+
+    def add(self, record):
+        """Adds a record to the index
+
+        Returns:
+            bool: True when the record is new and can be written, False when it is a duplicate kept in `pending`
+        """
+        record_id = record[self.key]
+        if self.add_id(record_id):
+            return True
+        self.pending[record_id] = record
+        self.duplicates += 1
+        return False
+
+    def replaced_ids(self):
+        """Ids of the pending records as written to CSV, the rows of their earlier copies are to be removed"""
+        return {str(record_id) for record_id in self.pending}
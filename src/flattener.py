@@ -0,0 +1,338 @@
+"""
+Declarative flattening of Retino records into output tables.
+
+Each endpoint declares its tables in an `EndpointSchema`. A table is described by the path to its rows
+inside a record (`each`) and by its columns. Columns read values from the record itself or from any level
+of the path, e.g. the option labels of a custom field read the option id from the option and the language
+and label from the translations of the option:
+
+    Table('_option_labels', primary_key=['option_id', 'language_code'],
+          each=[Items('options'), Translations('label')],
+          columns=[Column('option_id', Field('id', level=1)),
+                   Column('language_code', Key()),
+                   Column('value', Value())])
+
+Schemas are compiled once into row extractors, and `Flattener` emits rows of all tables of an endpoint
+in a single pass over the records. `flatten_to_csv` flattens a batch of records to CSV text of the tables
+in a worker process, so large loads can be flattened on all cores.
+"""
+import csv
+import io
+import operator
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+MISSING = object()
+
+
+def select_name_by_preference(names, lang="en"):
+    """Settles the name based on the preferred language order
+
+    Args:
+        names (dict): The names in different languages
+
+    Returns:
+        str: The name in the preferred language
+    """
+
+    # Language preference order
+    preferred_languages = [lang, 'en', 'cs']
+    for lang in preferred_languages:
+        if lang in names:
+            return names[lang]
+
+    # Fallback: If no preferred language is available, use the first available translation
+    first_key = list(names.keys())[0]
+    return f"{names[first_key]} ({first_key})"
+
+
+# Value sources, `level` is the index in the path: 0 is the record, -1 the innermost item
+
+
+@dataclass(frozen=True)
+class Field:
+    """Value of a (dotted) key, e.g. `price.with_vat`. Without a default, a missing key fails the endpoint"""
+    path: str
+    level: int = -1
+    default: object = MISSING
+
+    def compile(self):
+        keys = self.path.split('.')
+        level = self.level
+        default = self.default
+        if default is MISSING:
+            if len(keys) == 1:
+                getter = operator.itemgetter(keys[0])
+                return lambda context: getter(context[level])
+
+            def get_nested(context):
+                value = context[level]
+                for key in keys:
+                    value = value[key]
+                return value
+            return get_nested
+
+        def get_with_default(context):
+            value = context[level]
+            for key in keys:
+                if not isinstance(value, dict) or key not in value:
+                    return default
+                value = value[key]
+            return value
+        return get_with_default
+
+
+@dataclass(frozen=True)
+class Key:
+    """Key of the innermost translation"""
+
+    def compile(self):
+        return lambda context: context[-1][0]
+
+
+@dataclass(frozen=True)
+class Value:
+    """Value of the innermost translation"""
+
+    def compile(self):
+        return lambda context: context[-1][1]
+
+
+@dataclass(frozen=True)
+class Computed:
+    """Value computed by a function from the record at the given level"""
+    function: Callable
+    level: int = -1
+
+    def compile(self):
+        function = self.function
+        level = self.level
+        return lambda context: function(context[level])
+
+
+# Path steps
+
+
+@dataclass(frozen=True)
+class Items:
+    """Iterates a list of nested objects, e.g. `products`. A missing list yields no rows"""
+    key: str
+
+    def compile(self):
+        key = self.key
+        return lambda item: item.get(key) or ()
+
+
+@dataclass(frozen=True)
+class Nested:
+    """Steps into a single nested object, e.g. `bound_order`. Without `optional`, a missing object fails"""
+    key: str
+    optional: bool = False
+
+    def compile(self):
+        key = self.key
+        if self.optional:
+            return lambda item: (item[key],) if item.get(key) is not None else ()
+        return lambda item: (item[key],)
+
+
+@dataclass(frozen=True)
+class Translations:
+    """Iterates `(language_code, value)` pairs of a translated attribute, e.g. `name`"""
+    key: str
+
+    def compile(self):
+        key = self.key
+        return lambda item: (item.get(key) or {}).items()
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    source: object
+
+
+@dataclass(frozen=True)
+class Table:
+    """An output table, named `{endpoint}{suffix}.csv`"""
+    suffix: str
+    columns: List[Column]
+    primary_key: List[str]
+    each: List[object] = field(default_factory=list)
+
+    @property
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    def compile(self):
+        """Compiles the table to a function returning the rows of a single record"""
+        getters = [column.source.compile() for column in self.columns]
+        steps = [step.compile() for step in self.each]
+
+        def row(context):
+            return [getter(context) for getter in getters]
+
+        if not steps:
+            return lambda record: (row((record,)),)
+
+        def rows(record):
+            result = []
+            contexts = [(record,)]
+            for step in steps:
+                contexts = [context + (item,) for context in contexts for item in step(context[-1])]
+            for context in contexts:
+                result.append(row(context))
+            return result
+        return rows
+
+
+@dataclass(frozen=True)
+class EndpointSchema:
+    tables: List[Table]
+
+    def table_name(self, endpoint, table):
+        return f'{endpoint}{table.suffix}'
+
+
+class Flattener:
+    """
+    Writes records of an endpoint to all of its tables in a single pass.
+
+    Usage:
+
+        with TableWriterSet(folder) as tables:
+            flattener = Flattener(SCHEMAS['tags'], 'tags', tables)
+            for record in records:
+                flattener.write(record)
+    """
+
+    def __init__(self, schema, endpoint, tables):
+        self.schema = schema
+        self.endpoint = endpoint
+        self.extractors = []
+        # number of rows written to each table
+        self.rows = {}
+        for table in schema.tables:
+            name = schema.table_name(endpoint, table)
+            tables.add_table(name, table.column_names)
+            self.rows[name] = 0
+            self.extractors.append((name, tables.writer(name).writerows, table.compile()))
+        self.tables = tables
+
+    def write(self, record):
+        rows = self.rows
+        for name, writerows, extract in self.extractors:
+            table_rows = extract(record)
+            writerows(table_rows)
+            rows[name] += len(table_rows)
+
+    def write_chunks(self, chunks):
+        """Appends CSV chunks of the tables returned by `flatten_to_csv`"""
+        for name, text, rows in chunks:
+            self.tables.write_csv(name, text, rows)
+            self.rows[name] += rows
+
+
+# row extractors of the tables of each endpoint, compiled once in each worker process
+_worker_extractors = {}
+
+
+def flatten_to_csv(endpoint, records):
+    """Flattens records of an endpoint to CSV text of each of its tables, run in worker processes
+
+    Workers receive only the name of the endpoint and compile its schema themselves, as schemas with computed
+    columns cannot be pickled.
+
+    Returns:
+        list: (table name, CSV rows without a header, number of rows) of each table of the endpoint
+    """
+    extractors = _worker_extractors.get(endpoint)
+    if extractors is None:
+        schema = SCHEMAS[endpoint]
+        extractors = [(schema.table_name(endpoint, table), table.compile()) for table in schema.tables]
+        _worker_extractors[endpoint] = extractors
+    chunks = []
+    for name, extract in extractors:
+        buffer = io.StringIO()
+        writerows = csv.writer(buffer).writerows
+        rows = 0
+        for record in records:
+            table_rows = extract(record)
+            writerows(table_rows)
+            rows += len(table_rows)
+        chunks.append((name, buffer.getvalue(), rows))
+    return chunks
+
+
+def translations_table(suffix, parent_column, value_column='name', key='name'):
+    """A table of translations of an attribute, keyed by the parent id and the language code"""
+    return Table(suffix, primary_key=[parent_column, 'language_code'], each=[Translations(key)],
+                 columns=[Column(parent_column, Field('id', level=0)),
+                          Column('language_code', Key()),
+                          Column(value_column, Value())])
+
+
+def custom_fields_schema():
+    return EndpointSchema([
+        Table('_fields', primary_key=['id'],
+              columns=[Column('id', Field('id')), Column('type', Field('type')),
+                       Column('position', Field('position'))]),
+        translations_table('_names', 'field_id', value_column='value'),
+        Table('_options', primary_key=['id', 'field_id'], each=[Items('options')],
+              columns=[Column('id', Field('id')), Column('field_id', Field('id', level=0))]),
+        Table('_option_labels', primary_key=['option_id', 'language_code'],
+              each=[Items('options'), Translations('label')],
+              columns=[Column('option_id', Field('id', level=1)),
+                       Column('language_code', Key()),
+                       Column('value', Value())]),
+    ])
+
+
+def ticket_child_table(suffix, each, columns):
+    return Table(suffix, primary_key=['ticket_id', 'id'], each=each,
+                 columns=[Column('ticket_id', Field('id', level=0))] + columns)
+
+
+SCHEMAS = {
+    "custom-fields": custom_fields_schema(),
+    "product-custom-fields": custom_fields_schema(),
+    "refund-accounts": EndpointSchema([
+        Table('', primary_key=['id'],
+              columns=[Column(name, Field(name)) for name in ['id', 'name', 'bank_account', 'currency', 'due_date']]),
+    ]),
+    "states": EndpointSchema([
+        Table('', primary_key=['id'], columns=[Column('id', Field('id'))]),
+        translations_table('_names', 'state_id'),
+    ]),
+    "tags": EndpointSchema([
+        Table('', primary_key=['id'],
+              columns=[Column('id', Field('id')), Column('fgcolor', Field('fgcolor')),
+                       Column('bgcolor', Field('bgcolor'))]),
+        translations_table('_names', 'tag_id'),
+    ]),
+    "types": EndpointSchema([
+        Table('', primary_key=['id'],
+              columns=[Column('id', Field('id')),
+                       Column('name', Computed(lambda type_: select_name_by_preference(type_['name'])))]),
+        translations_table('_names', 'type_id'),
+    ]),
+    "users": EndpointSchema([
+        Table('', primary_key=['id'],
+              columns=[Column(name, Field(name)) for name in ['id', 'role', 'email', 'full_name', 'phone_number',
+                                                              'last_activity_at', 'date_joined']]),
+    ]),
+    "tickets": EndpointSchema([
+        Table('', primary_key=['id'],
+              columns=[Column(name, Field(name)) for name in ['id', 'company', 'code', 'state', 'type', 'owner']]),
+        ticket_child_table('_bound_orders', [Nested('bound_order')],
+                           [Column(name, Field(name)) for name in ['id', 'code', 'remote_id', 'order_date',
+                                                                   'currency']]),
+        ticket_child_table('_products', [Items('products')],
+                           [Column('id', Field('id')), Column('bound_order_item', Field('bound_order_item')),
+                            Column('price_with_vat', Field('price.with_vat')), Column('name', Field('name')),
+                            Column('manufacturer', Field('manufacturer'))]),
+        ticket_child_table('_history', [Items('history_items')],
+                           [Column('id', Field('id')), Column('history_item_type', Field('history_item_type')),
+                            Column('text', Field('history_item_data.text', default=''))]),
+    ]),
+}
@@ -0,0 +1,176 @@
+"""
+Runtime metrics of a run, written as a machine-readable report so performance can be tracked between runs.
+
+Metrics are collected per endpoint: requests and pages fetched, failed requests, bytes received, retries,
+request latencies (including failed requests), rows written to each output table and the time spent in each
+stage - `fetch` (requests including retries and backoff), `decode` (JSON decoding) and `write` (flattening and
+CSV writing). Stage times are cumulative over all threads of the endpoint, so with parallel page fetching they
+may exceed the elapsed time.
+"""
+import collections
+import contextlib
+import json
+import math
+import threading
+import time
+
+# latency percentiles included in the report
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of sorted values, None when there are no values"""
+    if not values:
+        return None
+    return values[max(1, math.ceil(len(values) * percent / 100)) - 1]
+
+
+class EndpointMetrics:
+    """Counters of a single endpoint, safe to update from multiple threads"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.requests = 0
+        self.failed_requests = 0
+        self.pages = 0
+        self.retries = 0
+        self.bytes_received = 0
+        self.latencies = []
+        self.stages = collections.defaultdict(float)
+        self.rows = collections.Counter()
+        self.elapsed = None
+        self.status = None
+        self._lock = threading.Lock()
+
+    def record_request(self, latency, size):
+        """Records a successful request, its latency in seconds and the size of the response in bytes"""
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += size
+            self.latencies.append(latency)
+
+    def record_failed_request(self, latency):
+        """Records a request failing without a retry, or the last retry of a request, and its latency in seconds"""
+        with self._lock:
+            self.failed_requests += 1
+            self.latencies.append(latency)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def add_pages(self, pages=1):
+        with self._lock:
+            self.pages += pages
+
+    def add_rows(self, rows):
+        """Adds numbers of rows written to output tables
+
+        Args:
+            rows (dict): Number of rows by table name
+        """
+        with self._lock:
+            self.rows.update(rows)
+
+    def add_stage_time(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        """Measures the time spent in the block as a stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, time.perf_counter() - started)
+
+    def to_dict(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            latency = {f"p{percent}": percentile(latencies, percent) for percent in LATENCY_PERCENTILES}
+            latency["max"] = latencies[-1] if latencies else None
+            return {
+                "status": self.status,
+                "elapsed_seconds": self.elapsed,
+                "requests": self.requests,
+                "failed_requests": self.failed_requests,
+                "pages": self.pages,
+                "retries": self.retries,
+                "bytes_received": self.bytes_received,
+                "latency_seconds": latency,
+                "stage_seconds": dict(self.stages),
+                "rows_written": dict(self.rows),
+            }
+
+
+class RunMetrics:
+    """
+    Metrics of all endpoints of a run.
+
+    Usage:
+
+        metrics = RunMetrics()
+        with metrics.endpoint('tickets').stage('write'):
+            ...
+        metrics.write('out/files/run_metrics.json')
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def endpoint(self, endpoint):
+        """Returns the metrics of an endpoint, creating them on first use"""
+        with self._lock:
+            if endpoint not in self.endpoints:
+                self.endpoints[endpoint] = EndpointMetrics(endpoint)
+            return self.endpoints[endpoint]
+
+    def record_results(self, results):
+        """Records the elapsed time and the status of finished endpoint jobs
+
+        Args:
+            results (list): EndpointResult of each endpoint
+        """
+        for result in results:
+            metrics = self.endpoint(result.endpoint)
+            metrics.elapsed = result.elapsed
+            metrics.status = "failed" if result.error else "ok"
+
+    def totals(self):
+        """Returns the counters summed over all endpoints"""
+        totals = dict.fromkeys(("requests", "failed_requests", "pages", "retries", "bytes_received", "rows_written"),
+                               0)
+        stages = collections.Counter()
+        for metrics in list(self.endpoints.values()):
+            report = metrics.to_dict()
+            for key in ("requests", "failed_requests", "pages", "retries", "bytes_received"):
+                totals[key] += report[key]
+            totals["rows_written"] += sum(report["rows_written"].values())
+            stages.update(report["stage_seconds"])
+        totals["stage_seconds"] = dict(stages)
+        return totals
+
+    def report(self):
+        return {
+            "started_at": self.started_at,
+            "elapsed_seconds": time.time() - self.started_at,
+            "totals": self.totals(),
+            "endpoints": {endpoint: metrics.to_dict() for endpoint, metrics in self.endpoints.items()},
+        }
+
+    def write(self, path):
+        """Writes the report as a JSON file"""
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+    def summary(self):
+        """Returns a single line summary of the run"""
+        totals = self.totals()
+        stages = ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in sorted(totals["stage_seconds"].items()))
+        return (f"Run metrics: {totals['requests']} requests, {totals['pages']} pages, {totals['retries']} retries, "
+                f"{totals['failed_requests']} failed requests, "
+                f"{totals['bytes_received'] / 1024 / 1024:.1f} MB received, {totals['rows_written']} rows written "
+                f"in {time.time() - self.started_at:.2f} s" + (f" ({stages})" if stages else ""))
@@ -0,0 +1,118 @@
+"""
+Record/replay cache of raw API pages.
+
+In the `record` mode, the body of every successful response is stored gzipped in the cache folder, keyed by
+the endpoint and the query parameters (including the page). In the `replay` mode, responses are served from the
+cache without any request to the API, so output tables can be rebuilt after a change of the processing, and
+recorded pages can be used as fixtures of tests and benchmarks.
+
+The parameters of the first page of a download depend on the state and on the preflight of the run (e.g. the last
+update of an incremental download), so they are recorded too and a replay starts each download with them.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import requests
+
+RECORD = "record"
+REPLAY = "replay"
+MODES = (RECORD, REPLAY)
+# recorded parameters of the first page of each download
+REQUESTS_FILE = "requests.json"
+
+
+class PageCacheMiss(requests.exceptions.RequestException):
+    """Raised in the replay mode when a page was not recorded"""
+
+
+class PageCache:
+    """
+    Stores and serves raw pages of the API.
+
+    Usage:
+
+        cache = PageCache('/data/page_cache', 'record')
+        cache.record('tickets', {'page': 1}, response)
+
+        cache = PageCache('/data/page_cache', 'replay')
+        response = cache.replay('tickets', {'page': 1})
+    """
+
+    def __init__(self, folder, mode):
+        if mode not in MODES:
+            raise ValueError(f"Unknown page cache mode '{mode}', use one of {', '.join(MODES)}")
+        self.folder = folder
+        self.mode = mode
+        self._lock = threading.Lock()
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def path(self, endpoint, params):
+        """Path of the cached page, the query parameters are hashed in a stable order"""
+        query = json.dumps({str(key): str(value) for key, value in (params or {}).items()}, sort_keys=True)
+        digest = hashlib.sha256(query.encode()).hexdigest()[:32]
+        return os.path.join(self.folder, endpoint.strip("/").replace("/", "_"), f"{digest}.json.gz")
+
+    def first_request(self, download, params, offset=0):
+        """Returns the parameters and the offset of the first page of a download
+
+        When recording, the parameters are stored under the name of the download and returned unchanged. When
+        replaying, the recorded ones are returned, or the given ones if the download was not recorded.
+
+        Args:
+            download (str): Name of the download, e.g. the endpoint
+            params (dict): Query parameters of the first page
+            offset (int): Number of records before the first page
+        """
+        path = os.path.join(self.folder, REQUESTS_FILE)
+        with self._lock:
+            try:
+                with open(path) as file:
+                    downloads = json.load(file)
+            except FileNotFoundError:
+                downloads = {}
+            if self.replaying:
+                recorded = downloads.get(download)
+                return (dict(recorded["params"]), recorded["offset"]) if recorded else (params, offset)
+            downloads[download] = {"params": params, "offset": offset}
+            os.makedirs(self.folder, exist_ok=True)
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(downloads, file, indent=2, sort_keys=True)
+            os.replace(temporary_path, path)
+        return params, offset
+
+    def record(self, endpoint, params, response):
+        """Stores the body of a successful response, reading it when the response is streamed"""
+        path = self.path(endpoint, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with gzip.open(temporary_path, "wb", compresslevel=6) as file:
+            file.write(response.content)
+        os.replace(temporary_path, path)
+
+    def replay(self, endpoint, params):
+        """Returns a recorded page as a response
+
+        Raises:
+            PageCacheMiss: When the page was not recorded
+        """
+        path = self.path(endpoint, params)
+        try:
+            with gzip.open(path, "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            raise PageCacheMiss(f"Page of {endpoint} with parameters {params} was not recorded in the page cache "
+                                f"{self.folder}") from None
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response.url = f"{endpoint}?{requests.compat.urlencode(params or {})}"
+        response._content = content
+        response._content_consumed = True
+        return response
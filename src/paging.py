@@ -0,0 +1,76 @@
+import logging
+
+# smallest page size the adaptive mode shrinks to
+DEFAULT_MIN_PAGE_SIZE = 10
+# largest page size the adaptive mode grows to
+DEFAULT_MAX_PAGE_SIZE = 1000
+# response time budget of a single page in seconds
+DEFAULT_MAX_RESPONSE_TIME = 10.0
+# payload budget of a single page in bytes
+DEFAULT_MAX_RESPONSE_BYTES = 8 * 1024 * 1024
+
+
+class AdaptivePageSize:
+    """
+    Chooses the page size of the next request based on how the API handled the previous ones.
+
+    The size doubles while responses stay within half of the time and payload budget, halves when a response
+    exceeds the budget and halves when a request times out or fails with a 5xx error.
+
+    Page sizes are always `min_size * 2 ** k`. The API paginates by page number, so the next page
+    is requested with the largest allowed size that divides the number of records already read,
+    which keeps the pages aligned and no record is skipped or read twice.
+    """
+
+    def __init__(self, initial_size, min_size=DEFAULT_MIN_PAGE_SIZE, max_size=DEFAULT_MAX_PAGE_SIZE,
+                 max_response_time=DEFAULT_MAX_RESPONSE_TIME, max_response_bytes=DEFAULT_MAX_RESPONSE_BYTES):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.max_response_time = max_response_time
+        self.max_response_bytes = max_response_bytes
+        self.target = self.min_size
+        while self.target * 2 <= min(initial_size, self.max_size):
+            self.target *= 2
+
+    def next_page(self, offset):
+        """Returns the page number and page size of the next request
+
+        Args:
+            offset (int): Number of records already read
+
+        Returns:
+            tuple: (page, page_size)
+        """
+        size = self.target
+        while size > self.min_size and offset % size:
+            size //= 2
+        return offset // size + 1, size
+
+    @property
+    def can_shrink(self):
+        return self.target > self.min_size
+
+    def record_success(self, elapsed, response_bytes):
+        """Adjusts the page size after a successful response
+
+        Args:
+            elapsed (float): Response time in seconds
+            response_bytes (int): Size of the response body
+        """
+        if elapsed > self.max_response_time or response_bytes > self.max_response_bytes:
+            self._resize(self.target // 2, f"response took {elapsed:.1f} s and has {response_bytes} bytes")
+        elif elapsed < self.max_response_time / 2 and response_bytes < self.max_response_bytes / 2:
+            self._resize(self.target * 2, None)
+
+    def record_failure(self, reason):
+        """Shrinks the page size after a timeout or a server error"""
+        self._resize(self.target // 2, reason)
+
+    def _resize(self, size, reason):
+        if size < self.min_size or size > self.max_size:
+            return
+        if reason:
+            logging.info(f"Reducing page size from {self.target} to {size}: {reason}")
+        else:
+            logging.debug(f"Increasing page size from {self.target} to {size}")
+        self.target = size
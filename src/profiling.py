@@ -0,0 +1,142 @@
+"""
+Opt-in profiling of the stages of a run, for diagnosing slow runs without changing the code.
+
+Each stage is profiled by cProfile and, optionally, the allocations of the run still held at the end of the stage
+are taken from a tracemalloc snapshot. Repeated runs of a stage are merged, e.g. the manifests of all endpoints.
+A stage started inside another stage in the same thread is profiled on its own, and its time is excluded from
+the outer stage. Snapshots are slow, so they are taken only at the end of outermost stages.
+
+cProfile follows only the thread that entered the stage, work of helper threads shows up as waiting for them,
+unless they run a stage of their own: the producer of pipelined pages is profiled as the `{endpoint}-fetch` stage,
+while pooled workers (e.g. parallel page fetching) are not profiled in detail. tracemalloc traces all threads,
+so a snapshot includes allocations of stages running in parallel.
+"""
+import cProfile
+import contextlib
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# number of functions and allocation sites listed in the report of a stage
+DEFAULT_TOP = 30
+# frames stored for each traced allocation
+TRACEMALLOC_FRAMES = 1
+# allocations of the profiling itself are left out of the reports
+PROFILER_FILES = tuple(os.path.splitext(module.__file__)[0] for module in (cProfile, pstats, tracemalloc)) \
+    + (os.path.splitext(__file__)[0],)
+
+
+class StageProfiler:
+    """
+    Profiles stages of a run, safe to use from multiple threads.
+
+    Usage:
+
+        profiler = StageProfiler(enabled=True)
+        profiler.start()
+        with profiler.stage('tickets'):
+            download_tickets()
+        profiler.stop()
+        for stage in profiler.stages:
+            profiler.write_stage(stage, 'tickets.prof', 'tickets.txt')
+    """
+
+    def __init__(self, enabled=False, allocations=True, top=DEFAULT_TOP):
+        self.enabled = enabled
+        self.allocations = enabled and allocations
+        self.top = top
+        self._stats = {}
+        self._durations = {}
+        self._runs = {}
+        self._allocated = {}
+        self._started_tracing = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def stages(self):
+        """Names of the profiled stages, in the order they were first completed"""
+        return list(self._stats)
+
+    def start(self):
+        """Starts tracing allocations, if enabled"""
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracing = True
+
+    def stop(self):
+        """Stops tracing allocations started by `start`"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Profiles the block as a stage, does nothing when profiling is disabled"""
+        if not self.enabled:
+            yield
+            return
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        if stack:
+            stack[-1].disable()
+        profile = cProfile.Profile()
+        stack.append(profile)
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - started
+            stack.pop()
+            snapshot = tracemalloc.take_snapshot() if self.allocations and not stack and tracemalloc.is_tracing() \
+                else None
+            self._add(name, profile, duration, snapshot)
+            if stack:
+                stack[-1].enable()
+
+    def _add(self, name, profile, duration, snapshot):
+        with self._lock:
+            if name in self._stats:
+                self._stats[name].add(profile)
+            else:
+                self._stats[name] = pstats.Stats(profile)
+            self._durations[name] = self._durations.get(name, 0.0) + duration
+            self._runs[name] = self._runs.get(name, 0) + 1
+        if snapshot is None:
+            return
+        held = {}
+        for statistic in snapshot.statistics('lineno'):
+            if not statistic.traceback[0].filename.startswith(PROFILER_FILES):
+                held[statistic.traceback] = (statistic.size, statistic.count)
+        with self._lock:
+            # a repeated stage reports the most memory held by each line at the end of any of its runs
+            allocated = self._allocated.setdefault(name, {})
+            for traceback, (size, count) in held.items():
+                if size > allocated.get(traceback, (0, 0))[0]:
+                    allocated[traceback] = (size, count)
+
+    def report(self, name):
+        """Returns a text report of a stage: the functions with the highest cumulative time and the top allocations"""
+        stream = io.StringIO()
+        stream.write(f"Stage {name}: {self._runs[name]} runs, {self._durations[name]:.3f} s\n\n")
+        stats = self._stats[name]
+        stats.stream = stream
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        if name in self._allocated:
+            stream.write("Top allocations of the run still held at the end of the stage (size, blocks, line):\n")
+            top = sorted(self._allocated[name].items(), key=lambda item: item[1][0], reverse=True)[:self.top]
+            for traceback, (size, count) in top:
+                stream.write(f"{size / 1024:12.1f} KiB {count:9d}  {traceback}\n")
+        return stream.getvalue()
+
+    def write_stage(self, name, profile_path, report_path):
+        """Writes the cProfile statistics of a stage, readable by `pstats` or snakeviz, and its text report"""
+        self._stats[name].dump_stats(profile_path)
+        with open(report_path, "w") as report_file:
+            report_file.write(self.report(name))
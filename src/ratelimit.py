@@ -0,0 +1,120 @@
+"""
+Rate limiting of requests to the Retino API shared by all threads of the component.
+"""
+import collections
+import logging
+import threading
+import time
+
+# headers announcing the remaining requests of the current rate limit window and its reset
+REMAINING_HEADERS = ("X-RateLimit-Remaining", "RateLimit-Remaining")
+RESET_HEADERS = ("X-RateLimit-Reset", "RateLimit-Reset")
+# reset values over this are epoch timestamps, lower values are seconds until the reset
+EPOCH_RESET_THRESHOLD = 10 ** 9
+# the rate is multiplied by this factor on every 429 and grows by RECOVERY_STEP (relative) on every success
+THROTTLE_FACTOR = 0.5
+RECOVERY_STEP = 0.02
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the rate of requests of all threads sharing it, adapting to the limits of the API.
+
+    Every request takes a token, tokens are refilled at `rate` per second up to `burst`. Without a `rate`,
+    requests are not limited until the API throttles them. On a 429 response, all requests are paused for
+    the `Retry-After` delay and the rate is halved, once per pause (starting from the rate measured over the last
+    second when no rate is set). Each successful request increases the rate slightly again, up to the configured `rate`.
+    When rate limit headers report no remaining requests, all requests are paused until the announced reset.
+
+    Usage:
+
+        limiter = RateLimiter(rate=10, burst=20)
+        limiter.acquire()
+        response = session.get(url)
+        limiter.observe(response.headers)
+    """
+
+    def __init__(self, rate=None, burst=None, min_rate=0.2, max_pause=60.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst if burst else max(1.0, rate or 1.0)
+        self.min_rate = min_rate
+        self.max_pause = max_pause
+        self.tokens = self.burst
+        self.paused_until = 0.0
+        self.throttles = 0
+        self._refilled = time.monotonic()
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request can be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if wait <= 0:
+                    wait = self._take_token(now)
+                    if wait <= 0:
+                        return
+            time.sleep(wait)
+
+    def _take_token(self, now):
+        """Takes a token, returns 0 on success or the time until a token is available"""
+        self._recent.append(now)
+        while self._recent and self._recent[0] < now - 1:
+            self._recent.popleft()
+        if self.rate is None:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        self._recent.pop()
+        return (1 - self.tokens) / self.rate
+
+    def throttle(self, delay):
+        """Slows down after a 429 response, pausing all requests for `delay` seconds
+
+        Concurrent requests throttled by the same rate limit event arrive while the pause is in effect,
+        they extend the pause but decrease the rate only once.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            decrease = now >= self.paused_until
+            self.paused_until = max(self.paused_until, now + min(delay, self.max_pause))
+            if decrease:
+                current = self.rate if self.rate is not None else max(len(self._recent), 1)
+                self.rate = max(self.min_rate, current * THROTTLE_FACTOR)
+            self.tokens = 0
+            self._refilled = now
+        if decrease:
+            logging.warning(f"The API is throttling requests, limiting the request rate to {self.rate:.2f}/s")
+
+    def observe(self, headers):
+        """Adapts to the rate limit headers of a successful response"""
+        remaining = self._header(headers, REMAINING_HEADERS)
+        reset = self._header(headers, RESET_HEADERS)
+        with self._lock:
+            if self.rate is not None and (self.max_rate is None or self.rate < self.max_rate):
+                self.rate *= 1 + RECOVERY_STEP
+                if self.max_rate is not None:
+                    self.rate = min(self.rate, self.max_rate)
+            if remaining is not None and remaining <= 0 and reset is not None:
+                now = time.monotonic()
+                delay = reset - time.time() if reset > EPOCH_RESET_THRESHOLD else reset
+                self.paused_until = max(self.paused_until, now + min(max(delay, 0.0), self.max_pause))
+
+    @staticmethod
+    def _header(headers, names):
+        for name in names:
+            value = headers.get(name)
+            if value is None:
+                continue
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+        return None
@@ -0,0 +1,171 @@
+import email.utils
+import logging
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from decoding import decode_response
+
+BASE_URL = "https://app.retino.com/api/v2/"
+
+# responses worth retrying, any other error status fails immediately
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetinoClient:
+    """
+    Client of the Retino API v2.
+
+    All requests share one pooled `requests.Session`, so connections (and TLS sessions) are reused between pages.
+    Responses are requested gzip compressed. Transient failures - connection errors, timeouts and the statuses
+    in `RETRY_STATUSES` - are retried with exponential backoff, honoring the `Retry-After` header if the API
+    sends one. Only the failing request is retried, the caller never has to restart the endpoint.
+
+    With `metrics` (a `metrics.RunMetrics`), requests, retries, latencies, response sizes and the time spent
+    fetching and decoding are recorded for each endpoint. With `rate_limiter` (a `ratelimit.RateLimiter`),
+    every request waits for the limiter, which is told about 429 responses and rate limit headers.
+    With `page_cache` (a `page_cache.PageCache`), successful responses are recorded, or served from the cache
+    without any request in the replay mode.
+    """
+
+    def __init__(self, token, base_url=BASE_URL, max_retries=5, backoff_factor=0.5, max_backoff=60.0,
+                 pool_size=10, timeout=60, metrics=None, rate_limiter=None, page_cache=None):
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.metrics = metrics
+        self.rate_limiter = rate_limiter
+        self.page_cache = page_cache
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Token {token}",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+        # retries are handled by the client itself, so they can honor Retry-After
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def endpoint_url(self, endpoint):
+        return f"{self.base_url}{endpoint}"
+
+    def get(self, endpoint, params=None, headers=None, stream=False, fail_fast=False):
+        """Sends a GET request to the endpoint, retrying transient failures
+
+        Args:
+            endpoint (str): Name of the endpoint, e.g. `tickets`
+            params (dict): Query parameters
+            headers (dict): Additional headers of the request, e.g. `If-None-Match`
+            stream (bool): Whether the body is left to be read from the response stream, the response has
+                to be closed by the caller
+            fail_fast (bool): Whether timeouts and 5xx responses fail without a retry, e.g. when the caller
+                shrinks the page instead. Connection errors and 429 responses are still retried
+
+        Returns:
+            requests.Response: The successful response
+
+        Raises:
+            requests.exceptions.RequestException: When the request fails or all retries are exhausted
+        """
+        url = self.endpoint_url(endpoint)
+        if self.page_cache is not None and self.page_cache.replaying:
+            return self.page_cache.replay(endpoint, params)
+        metrics = self.metrics.endpoint(endpoint) if self.metrics is not None else None
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+                sent = time.perf_counter()
+                try:
+                    response = self.session.get(url, params=params, headers=headers, timeout=self.timeout,
+                                                stream=stream)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if attempt >= self.max_retries or (fail_fast and isinstance(e, requests.exceptions.Timeout)):
+                        if metrics is not None:
+                            metrics.record_failed_request(time.perf_counter() - sent)
+                        raise
+                    delay = self.backoff_delay(attempt)
+                    logging.warning(f"Request to {url} failed ({str(e)}), retrying in {delay:.1f} s")
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries \
+                            or (fail_fast and response.status_code >= 500):
+                        if response.status_code >= 400 and metrics is not None:
+                            metrics.record_failed_request(time.perf_counter() - sent)
+                        response.raise_for_status()
+                        if self.rate_limiter is not None:
+                            self.rate_limiter.observe(response.headers)
+                        if self.page_cache is not None and response.status_code == 200:
+                            self.page_cache.record(endpoint, params, response)
+                        if metrics is not None:
+                            metrics.record_request(time.perf_counter() - sent,
+                                                   self.response_size(response, read_body=not stream))
+                        return response
+                    response.close()
+                    delay = self.retry_after(response)
+                    if delay is None:
+                        delay = self.backoff_delay(attempt)
+                    if response.status_code == 429 and self.rate_limiter is not None:
+                        # other threads wait for the API too
+                        self.rate_limiter.throttle(delay)
+                    logging.warning(f"Request to {url} returned {response.status_code}, retrying in {delay:.1f} s")
+                attempt += 1
+                if metrics is not None:
+                    metrics.record_retry()
+                time.sleep(delay)
+        finally:
+            if metrics is not None:
+                metrics.add_stage_time("fetch", time.perf_counter() - started)
+
+    def get_json(self, endpoint, params=None):
+        """Sends a GET request to the endpoint and returns the decoded JSON body"""
+        return self.decode(endpoint, self.get(endpoint, params))
+
+    def decode(self, endpoint, response):
+        """Returns the decoded JSON body of a response of the endpoint"""
+        if self.metrics is None:
+            return decode_response(response)
+        with self.metrics.endpoint(endpoint).stage("decode"):
+            return decode_response(response)
+
+    @staticmethod
+    def response_size(response, read_body=True):
+        """Size of the response body in bytes, as received when the API reports it
+
+        Args:
+            read_body (bool): Whether the size may be taken from the body, false for streamed responses
+        """
+        length = response.headers.get("Content-Length")
+        if length and str(length).isdigit():
+            return int(length)
+        content = response.content if read_body else None
+        return len(content) if isinstance(content, bytes) else 0
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    def retry_after(self, response):
+        """Returns the delay requested by the `Retry-After` header in seconds or None"""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            delay = retry_at.timestamp() - time.time()
+        return min(self.max_backoff, max(0.0, delay))
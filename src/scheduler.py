@@ -0,0 +1,66 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+@dataclass
+class EndpointResult:
+    endpoint: str
+    elapsed: float = 0.0
+    error: Exception = None
+
+
+class EndpointScheduler:
+    """
+    Runs independent endpoint jobs as concurrent tasks in a bounded worker pool.
+
+    A failing job is logged and does not affect the other jobs. Results are kept in the order
+    the jobs were added, so the timing summary is stable between runs.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max(1, max_workers)
+        self.jobs = []
+        self.results = []
+
+    def add(self, endpoint, func, *args, **kwargs):
+        """Registers a job downloading a single endpoint
+
+        Args:
+            endpoint (str): Name of the endpoint, used in logs and in the summary
+            func (callable): Function downloading and processing the endpoint
+        """
+        self.jobs.append((endpoint, func, args, kwargs))
+
+    def run(self):
+        """Runs all registered jobs and waits until they finish
+
+        Returns:
+            list: EndpointResult of each job
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="endpoint") as executor:
+            futures = [executor.submit(self._run_job, *job) for job in self.jobs]
+        self.results = [future.result() for future in futures]
+        return self.results
+
+    @staticmethod
+    def _run_job(endpoint, func, args, kwargs):
+        result = EndpointResult(endpoint)
+        started = time.perf_counter()
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            logging.error(f"Error downloading data for endpoint {endpoint}: {str(e)}")
+            result.error = e
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def log_summary(self):
+        """Logs the time spent on each endpoint"""
+        if not self.results:
+            return
+        logging.info("Endpoint timing summary:")
+        for result in self.results:
+            status = "failed" if result.error else "ok"
+            logging.info(f"  {result.endpoint}: {result.elapsed:.2f} s ({status})")
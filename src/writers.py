@@ -0,0 +1,223 @@
+import csv
+import gzip
+import io
+import os
+import shutil
+
+# default size of the write buffer of each output file in bytes
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# default number of rows in a single slice of a sliced table
+DEFAULT_SLICE_ROWS = 500000
+# compression level of gzipped slices, a balance between speed and size
+GZIP_COMPRESS_LEVEL = 6
+
+
+def rewrite_csv(path, keep, header=False, first_index=0):
+    """Rewrites a CSV file, gzipped when its name ends with `.gz`, keeping the rows for which `keep(index, row)`
+
+    Returns:
+        tuple: (index of the row following the last one, number of removed rows)
+    """
+    compressed = path.endswith('.gz')
+    temporary_path = f'{path}.tmp'
+    if compressed:
+        source = gzip.open(path, 'rt', encoding='utf-8', newline='')
+        target = gzip.open(temporary_path, 'wt', encoding='utf-8', newline='', compresslevel=GZIP_COMPRESS_LEVEL)
+    else:
+        source = open(path, newline='')
+        target = open(temporary_path, 'w', newline='')
+    index = first_index
+    removed = 0
+    with source, target:
+        reader = csv.reader(source)
+        writer = csv.writer(target)
+        if header:
+            writer.writerow(next(reader))
+        for row in reader:
+            if keep(index, row):
+                writer.writerow(row)
+            else:
+                removed += 1
+            index += 1
+    os.replace(temporary_path, path)
+    return index, removed
+
+
+class SlicedCsvWriter:
+    """
+    Writes rows of a table to a folder of CSV slices without a header, starting a new slice every `slice_rows` rows.
+
+    Storage imports the slices of a table in parallel, the columns of the table have to be listed in its manifest.
+    """
+
+    def __init__(self, folder, slice_rows=DEFAULT_SLICE_ROWS, compress=True, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.folder = folder
+        self.slice_rows = slice_rows
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.slices = 0
+        self._rows = 0
+        self._files = []
+        self._writer = None
+        os.makedirs(folder, exist_ok=True)
+        # the first slice is created even for an empty table
+        self._next_slice()
+
+    def _next_slice(self):
+        self._close_slice()
+        self.slices += 1
+        path = os.path.join(self.folder, f'part-{self.slices:05d}.csv')
+        if self.compress:
+            raw = open(f'{path}.gz', 'wb', buffering=self.buffer_size)
+            compressed = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_COMPRESS_LEVEL)
+            text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+            # closing the text wrapper closes the gzip stream, which does not close the file it writes to
+            self._files = [text, raw]
+        else:
+            text = open(path, 'w', newline='', buffering=self.buffer_size)
+            self._files = [text]
+        self._writer = csv.writer(text)
+        self._rows = 0
+
+    def _close_slice(self):
+        for file in self._files:
+            file.close()
+        self._files = []
+
+    def writerow(self, row):
+        if self._rows >= self.slice_rows:
+            self._next_slice()
+        self._writer.writerow(row)
+        self._rows += 1
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def write_csv(self, text, rows):
+        """Appends `rows` rows already formatted as CSV, a slice is never split inside the chunk"""
+        if self._rows and self._rows + rows > self.slice_rows:
+            self._next_slice()
+        self._files[0].write(text)
+        self._rows += rows
+
+    def close(self):
+        self._close_slice()
+
+
+class TableWriterSet:
+    """
+    Keeps a set of output CSV tables open for the whole run, so rows can be written without reopening the files.
+
+    Usage:
+
+        with TableWriterSet(folder) as tables:
+            tables.add_table('tickets', ['id', 'code'])
+            tables.writerow('tickets', [1, 'A'])
+
+    When the block fails, all files written by the set are removed, so no incomplete table is left behind.
+
+    With `slice_rows` set, tables are written as folders of headerless slices by SlicedCsvWriter, either all of them
+    or only the tables listed in `sliced_tables`.
+    """
+
+    def __init__(self, folder, buffer_size=DEFAULT_BUFFER_SIZE, slice_rows=None, compress=True, sliced_tables=None):
+        self.folder = folder
+        self.buffer_size = buffer_size
+        self.slice_rows = slice_rows
+        self.compress = compress
+        self.sliced_tables = sliced_tables
+        self.paths = {}
+        self.sliced = set()
+        self._files = {}
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    def is_sliced(self, name):
+        """Whether the table is written in slices, so its columns have to be listed in the manifest"""
+        return bool(self.slice_rows) and (self.sliced_tables is None or name in self.sliced_tables)
+
+    def add_table(self, name, columns):
+        """Opens the output file of a table and writes its header
+
+        Args:
+            name (str): Name of the table, the file (or the folder of slices) is named `{name}.csv`
+            columns (list): Header of the table, not written to sliced tables
+
+        Returns:
+            str: File path of the CSV file
+        """
+        path = os.path.join(self.folder, f'{name}.csv')
+        self.paths[name] = path
+        if self.is_sliced(name):
+            writer = SlicedCsvWriter(path, self.slice_rows, self.compress, self.buffer_size)
+            self.sliced.add(name)
+            self._files[name] = writer
+            self._writers[name] = writer
+        else:
+            file = open(path, 'w', newline='', buffering=self.buffer_size)
+            self._files[name] = file
+            self._writers[name] = csv.writer(file)
+            self._writers[name].writerow(columns)
+        return path
+
+    def writer(self, name):
+        """Returns the csv writer of a table"""
+        return self._writers[name]
+
+    def writerow(self, name, row):
+        self._writers[name].writerow(row)
+
+    def writerows(self, name, rows):
+        self._writers[name].writerows(rows)
+
+    def write_csv(self, name, text, rows):
+        """Appends `rows` rows of a table already formatted as CSV by a csv writer"""
+        if name in self.sliced:
+            self._writers[name].write_csv(text, rows)
+        else:
+            self._files[name].write(text)
+
+    def close(self):
+        """Flushes and closes all output files"""
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+        self._writers = {}
+
+    def filter_rows(self, name, keep):
+        """Rewrites a table closed by `close` keeping only the rows for which `keep(index, row)` is true
+
+        Rows are numbered from 0 in the order they were written, across all slices of a sliced table.
+        The header is always kept.
+
+        Returns:
+            int: Number of removed rows
+        """
+        path = self.paths[name]
+        if name not in self.sliced:
+            return rewrite_csv(path, keep, header=True)[1]
+        index = 0
+        removed = 0
+        for slice_name in sorted(os.listdir(path)):
+            index, slice_removed = rewrite_csv(os.path.join(path, slice_name), keep, first_index=index)
+            removed += slice_removed
+        return removed
+
+    def discard(self):
+        """Closes and removes all output files"""
+        self.close()
+        for path in self.paths.values():
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
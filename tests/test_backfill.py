@@ -0,0 +1,77 @@
+import csv
+import datetime
+import os
+import tempfile
+import unittest
+
+from backfill import backfill_windows, merge_windows, parse_date
+from writers import TableWriterSet
+
+
+def write_table(folder, name, rows):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f'{name}.csv'), 'w', newline='') as file:
+        csv.writer(file).writerows([['header']] + rows)
+
+
+class TestBackfill(unittest.TestCase):
+
+    def test_windows_cover_period(self):
+        windows = backfill_windows(parse_date("2024-01-01"), 10, parse_date("2024-01-25T00:00:00Z"))
+
+        self.assertEqual([("2024-01-01", "2024-01-11"), ("2024-01-11", "2024-01-21"), ("2024-01-21", "2024-01-25")],
+                         [(start.date().isoformat(), end.date().isoformat()) for start, end in windows])
+
+    def test_last_window_is_open_without_end(self):
+        start = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=25)
+
+        windows = backfill_windows(start, 10)
+
+        self.assertEqual(3, len(windows))
+        self.assertIsNone(windows[-1][1])
+
+    def test_merge_keeps_ticket_from_latest_window(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        older, newer = os.path.join(folder.name, 'older'), os.path.join(folder.name, 'newer')
+        write_table(older, 'tickets', [['1', 'old'], ['2', 'old']])
+        write_table(older, 'tickets_history', [['1', '10'], ['2', '20']])
+        write_table(newer, 'tickets', [['2', 'new']])
+        write_table(newer, 'tickets_history', [['2', '21']])
+        output = os.path.join(folder.name, 'out')
+        os.makedirs(output)
+
+        with TableWriterSet(output) as tables:
+            tables.add_table('tickets', ['id', 'code'])
+            tables.add_table('tickets_history', ['ticket_id', 'id'])
+            duplicates = merge_windows([older, newer], tables, ['tickets', 'tickets_history'])
+
+        self.assertEqual(1, duplicates)
+        with open(os.path.join(output, 'tickets.csv'), newline='') as file:
+            self.assertEqual([['id', 'code'], ['2', 'new'], ['1', 'old']], list(csv.reader(file)))
+        with open(os.path.join(output, 'tickets_history.csv'), newline='') as file:
+            self.assertEqual([['ticket_id', 'id'], ['2', '21'], ['1', '10']], list(csv.reader(file)))
+
+    def test_merge_keeps_rows_of_ticket_received_twice_in_window(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        window = os.path.join(folder.name, 'window')
+        write_table(window, 'tickets', [['1', 'first'], ['1', 'second']])
+        write_table(window, 'tickets_products', [['1', '100'], ['1', '101']])
+        output = os.path.join(folder.name, 'out')
+        os.makedirs(output)
+
+        with TableWriterSet(output) as tables:
+            tables.add_table('tickets', ['id', 'code'])
+            tables.add_table('tickets_products', ['ticket_id', 'id'])
+            duplicates = merge_windows([window], tables, ['tickets', 'tickets_products'])
+
+        self.assertEqual(0, duplicates)
+        with open(os.path.join(output, 'tickets.csv'), newline='') as file:
+            self.assertEqual([['id', 'code'], ['1', 'first'], ['1', 'second']], list(csv.reader(file)))
+        with open(os.path.join(output, 'tickets_products.csv'), newline='') as file:
+            self.assertEqual([['ticket_id', 'id'], ['1', '100'], ['1', '101']], list(csv.reader(file)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,11 +3,19 @@ Created on 12. 11. 2018
 
 @author: esner
 '''
+import csv
+import datetime
+import json
+import tempfile
+import threading
+import time
 import unittest
 import mock
 import os
+import shutil
 from freezegun import freeze_time
 
+import component
 from component import Component
 
 
@@ -23,6 +31,685 @@ class TestComponent(unittest.TestCase):
             comp.run()
 
 
+def build_ticket(ticket_id, updated_at="2024-05-01T10:00:00Z"):
+    return {
+        "id": ticket_id, "company": 1, "code": f"T{ticket_id}", "state": 2, "type": 3, "owner": 4,
+        "updated_at": updated_at,
+        "bound_order": {"id": ticket_id * 10, "code": f"O{ticket_id}", "remote_id": "r",
+                        "order_date": "2024-01-01", "currency": "CZK"},
+        "products": [{"id": ticket_id * 100, "bound_order_item": 1, "price": {"with_vat": "10.00"},
+                      "name": "Product", "manufacturer": "ACME"}],
+        "history_items": [{"id": ticket_id * 1000, "history_item_type": "note",
+                           "history_item_data": {"text": "hello"}}],
+    }
+
+
+def page_response(results, total_pages):
+    response = mock.MagicMock()
+    response.json.return_value = {"results": results, "total_pages": total_pages}
+    response.content = json.dumps(response.json.return_value).encode()
+    response.iter_content.side_effect = lambda chunk_size: iter([response.content])
+    response.status_code = 200
+    response.headers = {}
+    response.raise_for_status.return_value = None
+    return response
+
+
+def error_response(status_code):
+    response = mock.Mock(status_code=status_code, headers={})
+    response.raise_for_status.side_effect = component.requests.exceptions.HTTPError(f"{status_code} error",
+                                                                                     response=response)
+    return response
+
+
+class ComponentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        os.makedirs(os.path.join(self.data_dir.name, 'out', 'tables'))
+        os.makedirs(os.path.join(self.data_dir.name, 'out', 'files'))
+        self.write_config({'#api_token': 'token', 'data_selection': 'only tickets'})
+        sleep = mock.patch('retino_client.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def write_config(self, parameters, state=None):
+        with open(os.path.join(self.data_dir.name, 'config.json'), 'w') as config_file:
+            json.dump({'parameters': parameters}, config_file)
+        os.makedirs(os.path.join(self.data_dir.name, 'in'), exist_ok=True)
+        with open(os.path.join(self.data_dir.name, 'in', 'state.json'), 'w') as state_file:
+            json.dump(state or {}, state_file)
+
+    def build_component(self):
+        with mock.patch.dict(os.environ, {'KBC_DATADIR': self.data_dir.name}):
+            comp = Component()
+        comp.data_folder = comp.tables_out_path
+        return comp
+
+    def read_table(self, name):
+        with open(os.path.join(self.data_dir.name, 'out', 'tables', name), newline='') as table_file:
+            return list(csv.reader(table_file))
+
+
+class TestStreamingFetch(ComponentTestCase):
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_pages_are_fetched_lazily(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 2), page_response([build_ticket(2)], 2)]
+        comp = self.build_component()
+
+        pages = comp.iter_retino_pages('token', 'tickets')
+        self.assertEqual([1], [ticket['id'] for ticket in next(pages)])
+        self.assertEqual(1, get.call_count)
+        self.assertEqual([2], [ticket['id'] for ticket in next(pages)])
+        self.assertEqual(2, get.call_args.kwargs['params']['page'])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_process_tickets_consumes_stream(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 2), page_response([build_ticket(2)], 2)]
+        comp = self.build_component()
+
+        comp.process_endpoint(comp.iter_retino_records('token', 'tickets'), 'tickets')
+
+        self.assertEqual([['1'], ['2']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+        self.assertEqual(3, len(self.read_table('tickets_history.csv')))
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_ticket_received_twice_is_written_once(self, get):
+        moved = build_ticket(2, updated_at="2024-05-02T10:00:00Z")
+        moved["code"] = "T2-updated"
+        get.side_effect = [page_response([build_ticket(1), build_ticket(2)], 2),
+                           page_response([moved, build_ticket(3)], 2)]
+        comp = self.build_component()
+
+        comp.process_endpoint(comp.iter_retino_records('token', 'tickets'), 'tickets')
+
+        self.assertEqual([['1', 'T1'], ['3', 'T3'], ['2', 'T2-updated']],
+                         [row[:3:2] for row in self.read_table('tickets.csv')[1:]])
+        self.assertEqual(['1', '3', '2'], [row[0] for row in self.read_table('tickets_history.csv')[1:]])
+        self.assertEqual(3, comp.metrics.endpoint('tickets').rows['tickets_products'])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failed_stream_discards_partial_tables(self, get):
+        get.side_effect = component.requests.exceptions.ConnectionError()
+        comp = self.build_component()
+
+        with self.assertRaises(component.UserException):
+            comp.process_endpoint(comp.iter_retino_records('token', 'tickets'), 'tickets')
+
+        self.assertEqual([], os.listdir(comp.tables_out_path))
+        self.assertEqual(6, get.call_count)
+        self.assertEqual(5, self.sleep.call_count)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_parallel_pages_are_yielded_in_order(self, get):
+        def respond(url, params, timeout, **kwargs):
+            # later pages answer faster, so they complete out of order
+            time.sleep((6 - params['page']) * 0.01)
+            return page_response([build_ticket(params['page'])], 5)
+
+        get.side_effect = respond
+        comp = self.build_component()
+        comp.page_concurrency = 3
+
+        self.assertEqual([1, 2, 3, 4, 5], [ticket['id'] for ticket in comp.iter_retino_records('token', 'tickets')])
+        self.assertEqual(5, get.call_count)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_pipeline_fetches_pages_ahead_of_consumer(self, get):
+        get.side_effect = [page_response([build_ticket(page)], 4) for page in range(1, 5)]
+        comp = self.build_component()
+        comp.pipeline_pages = 2
+
+        records = comp.iter_retino_records('token', 'tickets')
+        self.assertEqual(1, next(records)['id'])
+        deadline = time.monotonic() + 5
+        while get.call_count < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(4, get.call_count)
+        self.assertEqual([2, 3, 4], [ticket['id'] for ticket in records])
+
+    @mock.patch.object(component, 'PIPELINE_POLL_SECONDS', 0.01)
+    @mock.patch('retino_client.requests.Session.get')
+    def test_pipeline_stops_fetching_when_write_fails(self, get):
+        get.side_effect = lambda url, params, timeout, **kwargs: page_response([build_ticket(params['page'])], 10)
+        comp = self.build_component()
+        comp.pipeline_pages = 1
+
+        with self.assertRaises(KeyError):
+            comp.process_endpoint(({**ticket, "company": None} if ticket["id"] < 2 else {"id": ticket["id"]}
+                                   for ticket in comp.iter_retino_records('token', 'tickets')), 'tickets')
+        for thread in threading.enumerate():
+            if thread.name == "pipeline":
+                thread.join(timeout=5)
+                self.assertFalse(thread.is_alive())
+
+        self.assertLessEqual(get.call_count, 4)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_pipeline_checkpoints_only_written_pages(self, get):
+        get.side_effect = [page_response([build_ticket(page)], 3) for page in range(1, 4)]
+        comp = self.build_component()
+        comp.pipeline_pages = 4
+
+        records = comp.iter_retino_records('token', 'tickets', page_size=1)
+        self.assertEqual([1, 2], [next(records)['id'], next(records)['id']])
+        for thread in threading.enumerate():
+            if thread.name == "pipeline":
+                thread.join(timeout=5)
+        self.assertEqual(3, get.call_count)
+        # the writer fails on the second page, after all pages were fetched
+        records.close()
+
+        self.assertEqual({component.STATE_TICKETS_CHECKPOINT: {
+            "offset": 1, "page_size": 1, "updated_at_from": None, "max_updated_at": "2024-05-01T10:00:00+00:00"}},
+            comp.state)
+
+    @unittest.skipUnless(component.decoding.STREAMING_AVAILABLE, "ijson is not installed")
+    @mock.patch('retino_client.requests.Session.get')
+    def test_streamed_pages_are_written(self, get):
+        get.side_effect = [page_response([build_ticket(1), build_ticket(2)], 2), page_response([build_ticket(3)], 2)]
+        comp = self.build_component()
+        comp.streaming_decode = True
+
+        comp.process_endpoint(comp.iter_retino_records('token', 'tickets'), 'tickets')
+
+        self.assertTrue(get.call_args.kwargs['stream'])
+        self.assertEqual([['1'], ['2'], ['3']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+        self.assertEqual(2, comp.metrics.endpoint('tickets').pages)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_adaptive_page_size_reads_every_ticket_once(self, get):
+        def respond(url, params, timeout, **kwargs):
+            if params['page_size'] > 40:
+                error = mock.Mock(status_code=502, headers={})
+                error.raise_for_status.side_effect = component.requests.exceptions.HTTPError(response=error)
+                return error
+            first = (params['page'] - 1) * params['page_size']
+            ids = range(first + 1, min(first + params['page_size'], 250) + 1)
+            return page_response([build_ticket(ticket_id) for ticket_id in ids], -(-250 // params['page_size']))
+
+        get.side_effect = respond
+        comp = self.build_component()
+        comp.adaptive_page_size = {"min_size": 10, "max_size": 160}
+
+        ids = [ticket['id'] for ticket in comp.iter_retino_records('token', 'tickets', page_size=10)]
+
+        self.assertEqual(list(range(1, 251)), ids)
+        self.assertLess(get.call_count, 25)
+        # the page shrinks on the first failed attempt, without waiting for retries
+        self.sleep.assert_not_called()
+
+    @mock.patch.object(component, 'FLATTEN_BATCH_SIZE', 2)
+    def test_tickets_flattened_in_processes_match_single_process(self):
+        tickets = [build_ticket(ticket_id) for ticket_id in range(1, 8)] + [build_ticket(3)]
+        tickets[4]["products"] = []
+        comp = self.build_component()
+        comp.process_endpoint(tickets, 'tickets')
+        expected = {name: self.read_table(name) for name in ['tickets.csv', 'tickets_products.csv']}
+
+        comp = self.build_component()
+        comp.flatten_processes = 2
+        self.addCleanup(lambda: comp.process_pool.shutdown())
+        comp.process_endpoint(tickets, 'tickets')
+
+        self.assertEqual(expected, {name: self.read_table(name) for name in expected})
+        self.assertEqual(6, comp.metrics.endpoint('tickets').rows['tickets_products'])
+
+    def test_sliced_output_lists_columns_in_manifest(self):
+        comp = self.build_component()
+        comp.output_slicing = {"slice_rows": 1, "tables": ["tickets_products"]}
+
+        comp.process_endpoint([build_ticket(1), build_ticket(2)], 'tickets')
+
+        self.assertEqual(2, len(os.listdir(os.path.join(comp.tables_out_path, 'tickets_products.csv'))))
+        with open(os.path.join(comp.tables_out_path, 'tickets_products.csv.manifest')) as manifest_file:
+            self.assertEqual(['ticket_id', 'id', 'bound_order_item', 'price_with_vat', 'name', 'manufacturer'],
+                             json.load(manifest_file)['columns'])
+        with open(os.path.join(comp.tables_out_path, 'tickets.csv.manifest')) as manifest_file:
+            self.assertEqual([], json.load(manifest_file)['columns'])
+
+
+class TestCheckpoint(ComponentTestCase):
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failed_page_keeps_written_pages_and_checkpoint(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 3), page_response([build_ticket(2)], 3)] \
+            + [component.requests.exceptions.ConnectionError()] * 6
+        comp = self.build_component()
+
+        with self.assertRaises(component.IncompleteDownloadError):
+            comp.process_endpoint(comp.iter_retino_records('token', 'tickets', page_size=1), 'tickets')
+
+        self.assertEqual([['1'], ['2']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+        self.assertIn('tickets.csv.manifest', os.listdir(comp.tables_out_path))
+        self.assertEqual({"offset": 2, "page_size": 1, "updated_at_from": None,
+                          "max_updated_at": "2024-05-01T10:00:00+00:00"},
+                         comp.state[component.STATE_TICKETS_CHECKPOINT])
+        self.assertNotIn('lastTicketsUpdate', comp.state)
+
+    @mock.patch.object(component, 'FLATTEN_BATCH_SIZE', 2)
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failed_page_keeps_pages_flattened_in_processes(self, get):
+        get.side_effect = [page_response([build_ticket(1), build_ticket(2)], 3), page_response([build_ticket(3)], 3)] \
+            + [component.requests.exceptions.ConnectionError()] * 6
+        comp = self.build_component()
+        comp.flatten_processes = 2
+        self.addCleanup(lambda: comp.process_pool.shutdown())
+
+        with self.assertRaises(component.IncompleteDownloadError):
+            comp.process_endpoint(comp.iter_retino_records('token', 'tickets', page_size=2), 'tickets')
+
+        self.assertEqual([['1'], ['2'], ['3']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+        self.assertEqual(4, comp.state[component.STATE_TICKETS_CHECKPOINT]["offset"])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_checkpoint_beyond_last_page_restarts_full_load(self, get):
+        for case, first_response in [("not found", error_response(404)), ("empty", page_response([], 1))]:
+            with self.subTest(case):
+                get.reset_mock()
+                get.side_effect = [first_response, page_response([build_ticket(1), build_ticket(2)], 1)]
+                comp = self.build_component()
+                comp.state = {component.STATE_TICKETS_CHECKPOINT: {
+                    "offset": 100, "page_size": 100, "updated_at_from": None, "max_updated_at": None}}
+
+                comp.download_endpoint('token', 'tickets')
+
+                self.assertEqual([2, 1], [call.kwargs['params']['page'] for call in get.call_args_list])
+                self.assertEqual([['1'], ['2']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+                with open(os.path.join(comp.tables_out_path, 'tickets.csv.manifest')) as manifest_file:
+                    self.assertFalse(json.load(manifest_file)['incremental'])
+                self.assertEqual(['lastTicketsUpdate'], list(comp.state))
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failed_restart_does_not_restore_stale_checkpoint(self, get):
+        get.side_effect = [error_response(404), component.requests.exceptions.ConnectionError("refused")]
+        comp = self.build_component()
+        comp.max_retries = 0
+        comp.state = {component.STATE_TICKETS_CHECKPOINT: {
+            "offset": 100, "page_size": 100, "updated_at_from": None, "max_updated_at": None}}
+
+        with self.assertRaises(component.UserException):
+            comp.download_endpoint('token', 'tickets')
+
+        self.assertEqual({}, comp.state)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_checkpoint_of_another_filter_is_dropped(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 1)]
+        comp = self.build_component()
+        comp.state = {component.STATE_TICKETS_CHECKPOINT: {
+            "offset": 1, "page_size": 1, "updated_at_from": "2024-05-01T10:00:00.000000Z", "max_updated_at": None}}
+
+        comp.download_endpoint('token', 'tickets')
+
+        self.assertEqual(1, get.call_args.kwargs['params']['page'])
+        with open(os.path.join(comp.tables_out_path, 'tickets.csv.manifest')) as manifest_file:
+            self.assertFalse(json.load(manifest_file)['incremental'])
+        self.assertNotIn(component.STATE_TICKETS_CHECKPOINT, comp.state)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failed_write_restores_checkpoint_of_previous_run(self, get):
+        malformed = build_ticket(3)
+        malformed["bound_order"] = None
+        get.side_effect = [page_response([build_ticket(2)], 3), page_response([malformed], 3)]
+        checkpoint = {"offset": 1, "page_size": 1, "updated_at_from": None,
+                      "max_updated_at": "2024-05-01T10:00:00+00:00"}
+        comp = self.build_component()
+        comp.pipeline_pages = 0
+        comp.state = {component.STATE_TICKETS_CHECKPOINT: dict(checkpoint), "lastTicketsUpdate": 1714500000}
+
+        with self.assertRaises(TypeError):
+            comp.process_endpoint(comp.iter_retino_records('token', 'tickets'), 'tickets')
+
+        self.assertEqual([], os.listdir(comp.tables_out_path))
+        self.assertEqual({component.STATE_TICKETS_CHECKPOINT: checkpoint, "lastTicketsUpdate": 1714500000},
+                         comp.state)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failed_write_drops_checkpoint(self, get):
+        malformed = build_ticket(3)
+        malformed["bound_order"] = None
+        get.side_effect = [page_response([build_ticket(1)], 3), page_response([build_ticket(2)], 3),
+                           page_response([malformed], 3)]
+        comp = self.build_component()
+        comp.pipeline_pages = 0
+
+        with self.assertRaises(TypeError):
+            comp.process_endpoint(comp.iter_retino_records('token', 'tickets', page_size=1), 'tickets')
+
+        self.assertEqual([], os.listdir(comp.tables_out_path))
+        self.assertEqual({}, comp.state)
+
+    @unittest.skipUnless(component.decoding.STREAMING_AVAILABLE, "ijson is not installed")
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failed_streamed_page_keeps_checkpoint(self, get):
+        broken = page_response([build_ticket(2), build_ticket(3)], 2)
+        chunk = broken.content[:len(broken.content) // 2 + 30]
+
+        def fail_mid_page(chunk_size):
+            yield chunk
+            raise component.requests.exceptions.ChunkedEncodingError("connection broken")
+
+        broken.iter_content.side_effect = fail_mid_page
+        get.side_effect = [page_response([build_ticket(1)], 2), broken]
+        comp = self.build_component()
+        comp.streaming_decode = True
+
+        with self.assertRaises(component.IncompleteDownloadError):
+            comp.process_endpoint(comp.iter_retino_records('token', 'tickets', page_size=1), 'tickets')
+
+        self.assertEqual(1, comp.state[component.STATE_TICKETS_CHECKPOINT]["offset"])
+        self.assertEqual(['1'], self.read_table('tickets.csv')[1][:1])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_run_resumes_from_checkpoint(self, get):
+        get.side_effect = [page_response([build_ticket(3)], 3)]
+        self.write_config({'#api_token': 'token', 'data_selection': 'only tickets', 'incremental_update': False},
+                          state={"ticketsCheckpoint": {"offset": 2, "page_size": 1, "updated_at_from": None}})
+        comp = self.build_component()
+
+        comp.run()
+
+        self.assertEqual({'page': 3, 'page_size': 1}, get.call_args.kwargs['params'])
+        self.assertEqual([['3']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+        with open(os.path.join(comp.tables_out_path, 'tickets.csv.manifest')) as manifest_file:
+            self.assertTrue(json.load(manifest_file)['incremental'])
+        with open(os.path.join(self.data_dir.name, 'out', 'state.json')) as state_file:
+            state = json.load(state_file)
+        self.assertNotIn('ticketsCheckpoint', state)
+        self.assertIn('lastTicketsUpdate', state)
+
+
+class TestWatermark(ComponentTestCase):
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_watermark_is_newest_update_minus_overlap(self, get):
+        get.side_effect = [page_response([build_ticket(1, "2024-05-01T10:00:00Z"),
+                                          build_ticket(2, "2024-05-01T14:30:00+02:00")], 1)]
+        comp = self.build_component()
+        comp.state = {"lastTicketsUpdate": 1714500000}
+        comp.watermark_overlap = 10
+
+        list(comp.iter_retino_records('token', 'tickets', increment=True))
+
+        self.assertEqual("2024-04-30T18:00:00.000000Z", get.call_args.kwargs['params']['updated_at_from'])
+        # 12:30 UTC minus 10 minutes
+        self.assertEqual(1714566000, comp.state["lastTicketsUpdate"])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_watermark_is_kept_without_new_tickets(self, get):
+        get.side_effect = [page_response([], 1)]
+        comp = self.build_component()
+        comp.state = {"lastTicketsUpdate": 1714500000}
+
+        list(comp.iter_retino_records('token', 'tickets', increment=True))
+
+        self.assertEqual(1714500000, comp.state["lastTicketsUpdate"])
+
+
+class TestChangePreflight(ComponentTestCase):
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_no_updated_tickets_writes_no_tables(self, get):
+        get.side_effect = [page_response([], 1)]
+        comp = self.build_component()
+        comp.state = {"lastTicketsUpdate": 1714500000}
+        comp.change_preflight = True
+
+        comp.download_endpoint('token', 'tickets', increment=True)
+
+        self.assertEqual(1, get.call_count)
+        self.assertEqual(1, get.call_args.kwargs['params']['page_size'])
+        self.assertEqual([], os.listdir(comp.tables_out_path))
+        self.assertEqual({"lastTicketsUpdate": 1714500000}, comp.state)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_updated_tickets_are_read_in_a_single_page(self, get):
+        preflight = page_response([build_ticket(1)], 3)
+        get.side_effect = [preflight, page_response([build_ticket(ticket_id) for ticket_id in (1, 2, 3)], 1)]
+        comp = self.build_component()
+        comp.state = {"lastTicketsUpdate": 1714500000}
+        comp.change_preflight = True
+
+        comp.download_endpoint('token', 'tickets', increment=True)
+
+        self.assertEqual(2, get.call_count)
+        self.assertEqual(3, get.call_args.kwargs['params']['page_size'])
+        self.assertEqual([['1'], ['2'], ['3']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_checkpoint_of_another_filter_does_not_skip_preflight(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 1), page_response([build_ticket(1)], 1)]
+        comp = self.build_component()
+        comp.state = {"lastTicketsUpdate": 1714500000, component.STATE_TICKETS_CHECKPOINT: {
+            "offset": 1, "page_size": 1, "updated_at_from": None, "max_updated_at": None}}
+        comp.change_preflight = True
+
+        comp.download_endpoint('token', 'tickets', increment=True)
+
+        self.assertEqual([(1, 1), (1, 1)], [(call.kwargs['params']['page'], call.kwargs['params']['page_size'])
+                                           for call in get.call_args_list])
+        self.assertNotIn(component.STATE_TICKETS_CHECKPOINT, comp.state)
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_single_page_is_capped_by_configured_page_size(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 3), page_response([build_ticket(1), build_ticket(2)], 2),
+                           page_response([build_ticket(3)], 2)]
+        comp = self.build_component()
+        comp.state = {"lastTicketsUpdate": 1714500000}
+        comp.change_preflight = True
+        comp.page_sizes = {"tickets": 2}
+
+        comp.download_endpoint('token', 'tickets', increment=True)
+
+        self.assertEqual(3, get.call_count)
+        self.assertEqual(2, get.call_args.kwargs['params']['page_size'])
+        self.assertEqual([['1'], ['2'], ['3']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+
+
+SETTINGS_RESPONSES = {
+    "custom-fields": [{"id": 1, "type": "text", "position": 1, "name": {"en": "Field"},
+                       "options": [{"id": 2, "label": {"en": "Option"}}]}],
+    "product-custom-fields": [{"id": 1, "type": "text", "position": 1, "name": {"en": "Field"}}],
+    "refund-accounts": [{"id": 1, "name": "Main", "bank_account": "123/0100", "currency": "CZK", "due_date": 14}],
+    "states": [{"id": 1, "name": {"en": "New"}}],
+    "tags": [{"id": 1, "fgcolor": "#000", "bgcolor": "#fff", "name": {"en": "VIP"}}],
+    "types": [{"id": 1, "name": {"en": "Return"}}],
+    "users": [{"id": 1, "role": "admin", "email": "a@b.c", "full_name": "A B", "phone_number": "",
+               "last_activity_at": None, "date_joined": "2024-01-01"}],
+}
+
+
+class TestRun(ComponentTestCase):
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failing_endpoint_does_not_stop_others(self, get):
+        def respond(url, params, timeout, **kwargs):
+            endpoint = url.rsplit('/', 1)[-1]
+            if endpoint == "tags":
+                raise component.requests.exceptions.ConnectionError("tags are down")
+            if endpoint == "tickets":
+                return page_response([build_ticket(1)], 1)
+            return page_response(SETTINGS_RESPONSES[endpoint], 1)
+
+        get.side_effect = respond
+        self.write_config({'#api_token': 'token', 'data_selection': 'all data', 'incremental_update': False})
+        comp = self.build_component()
+
+        with self.assertLogs(level='INFO') as logs:
+            comp.run()
+
+        tables = os.listdir(comp.tables_out_path)
+        self.assertIn('tickets.csv', tables)
+        self.assertIn('users.csv', tables)
+        self.assertNotIn('tags.csv', tables)
+        self.assertTrue(any('Error downloading data for endpoint tags' in line for line in logs.output))
+        self.assertTrue(any('tags:' in line and '(failed)' in line for line in logs.output))
+        self.assertTrue(any('tickets:' in line and '(ok)' in line for line in logs.output))
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_numeric_parameters_may_be_strings(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 1)]
+        self.write_config({'#api_token': 'token', 'data_selection': 'only tickets', 'write_buffer_size': '65536'})
+        comp = self.build_component()
+
+        comp.run()
+
+        self.assertEqual(65536, comp.write_buffer_size)
+        self.assertEqual([['1']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_run_writes_metrics_report(self, get):
+        responses = [page_response([build_ticket(1), build_ticket(2)], 2), page_response([build_ticket(3)], 2)]
+        get.side_effect = [mock.Mock(status_code=503, headers={"Retry-After": "0"})] + responses
+        comp = self.build_component()
+
+        with self.assertLogs(level='INFO') as logs:
+            comp.run()
+
+        report_path = os.path.join(self.data_dir.name, 'out', 'files', component.METRICS_FILE_NAME)
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        tickets = report["endpoints"]["tickets"]
+        self.assertEqual("ok", tickets["status"])
+        self.assertEqual((2, 2, 1), (tickets["requests"], tickets["pages"], tickets["retries"]))
+        self.assertEqual({"tickets": 3, "tickets_bound_orders": 3, "tickets_products": 3, "tickets_history": 3},
+                         tickets["rows_written"])
+        self.assertEqual({"decode", "fetch", "write"}, set(tickets["stage_seconds"]))
+        self.assertIsNotNone(tickets["latency_seconds"]["p95"])
+        self.assertTrue(os.path.exists(f"{report_path}.manifest"))
+        self.assertTrue(any('Run metrics: 2 requests, 2 pages, 1 retries' in line for line in logs.output))
+        self.assertIn('Endpoint timing summary', logs.output[-2])
+        self.assertIn('tickets:', logs.output[-1])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_replay_uses_request_parameters_of_recorded_run(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 2),
+                           page_response([build_ticket(1), build_ticket(2)], 1)]
+        parameters = {'#api_token': 'token', 'data_selection': 'only tickets', 'incremental_update': True,
+                      'page_cache': {'mode': 'record', 'folder': os.path.join(self.data_dir.name, 'page_cache')}}
+        self.write_config(parameters, state={"lastTicketsUpdate": 1714500000})
+        self.build_component().run()
+        recorded = self.read_table('tickets.csv')
+        shutil.rmtree(os.path.join(self.data_dir.name, 'out', 'tables'))
+        os.makedirs(os.path.join(self.data_dir.name, 'out', 'tables'))
+        get.reset_mock()
+
+        # the state of the recorded run has moved the watermark, which is a part of the request parameters
+        parameters['page_cache']['mode'] = 'replay'
+        self.write_config(parameters, state={"lastTicketsUpdate": 1714600000})
+        self.build_component().run()
+
+        get.assert_not_called()
+        self.assertEqual(recorded, self.read_table('tickets.csv'))
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_run_writes_stage_profiles(self, get):
+        get.side_effect = [page_response([build_ticket(1)], 1)]
+        self.write_config({'#api_token': 'token', 'data_selection': 'only tickets', 'profiling': {'top': 5}})
+        comp = self.build_component()
+
+        comp.run()
+
+        files = os.listdir(os.path.join(self.data_dir.name, 'out', 'files'))
+        for stage in ['tickets', 'tickets_fetch', 'manifests', 'state']:
+            self.assertIn(f'retino_profile_{stage}.prof', files)
+            self.assertIn(f'retino_profile_{stage}.txt.manifest', files)
+        with open(os.path.join(self.data_dir.name, 'out', 'files', 'retino_profile_tickets.txt')) as report_file:
+            self.assertIn('process_endpoint', report_file.read())
+        with open(os.path.join(self.data_dir.name, 'out', 'files', 'retino_profile_tickets_fetch.txt')) as report_file:
+            self.assertIn('iter_page_steps', report_file.read())
+
+
+class TestBackfill(ComponentTestCase):
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_failed_window_is_downloaded_by_next_run(self, get):
+        tickets = [build_ticket(1, "2024-01-05T00:00:00Z"), build_ticket(2, "2024-01-15T00:00:00Z"),
+                   build_ticket(3, "2024-01-25T00:00:00Z")]
+        failing = {"2024-01-11T00:00:00.000000Z"}
+
+        def respond(url, params, timeout, **kwargs):
+            if params['updated_at_from'] in failing:
+                raise component.requests.exceptions.ConnectionError("window is down")
+            return page_response([ticket for ticket in tickets
+                                  if params['updated_at_from'] <= ticket['updated_at'].replace('Z', '.000000Z')
+                                  < params['updated_at_to']], 1)
+
+        get.side_effect = respond
+        backfill = {'from': '2024-01-01', 'to': '2024-01-31', 'window_days': 10, 'workers': 3}
+        self.write_config({'#api_token': 'token', 'data_selection': 'only tickets', 'backfill': backfill,
+                           'max_retries': 0})
+        comp = self.build_component()
+        comp.run()
+
+        self.assertEqual([['1'], ['3']], sorted(row[:1] for row in self.read_table('tickets.csv')[1:]))
+        with open(os.path.join(self.data_dir.name, 'out', 'state.json')) as state_file:
+            state = json.load(state_file)
+        self.assertEqual(2, len(state[component.STATE_TICKETS_BACKFILL]['completed']))
+        self.assertNotIn('lastTicketsUpdate', state)
+
+        failing.clear()
+        self.write_config({'#api_token': 'token', 'data_selection': 'only tickets', 'backfill': backfill},
+                          state=state)
+        comp = self.build_component()
+        comp.run()
+
+        self.assertEqual([['2']], [row[:1] for row in self.read_table('tickets.csv')[1:]])
+        with open(os.path.join(comp.tables_out_path, 'tickets.csv.manifest')) as manifest_file:
+            self.assertTrue(json.load(manifest_file)['incremental'])
+        self.assertNotIn(component.STATE_TICKETS_BACKFILL, comp.state)
+        self.assertEqual(int(datetime.datetime(2024, 1, 24, 23, 55, tzinfo=datetime.timezone.utc).timestamp()),
+                         comp.state['lastTicketsUpdate'])
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_ignored_window_bound_fails_window(self, get):
+        get.side_effect = [page_response([build_ticket(1, "2024-01-05T00:00:00Z"),
+                                          build_ticket(2, "2024-01-15T00:00:00Z")], 1)]
+        comp = self.build_component()
+        window = (datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+                  datetime.datetime(2024, 1, 11, tzinfo=datetime.timezone.utc))
+
+        with self.assertRaises(component.UserException) as error:
+            comp.download_window('token', window, os.path.join(self.data_dir.name, 'window'))
+
+        self.assertIn("'updated_at_to' filter", str(error.exception))
+        self.assertEqual(1, get.call_count)
+
+
+class TestSettingsCache(ComponentTestCase):
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_unchanged_endpoint_is_not_written(self, get):
+        get.side_effect = lambda url, params, timeout, **kwargs: page_response(SETTINGS_RESPONSES["tags"], 1)
+        comp = self.build_component()
+        comp.settings_cache = True
+
+        comp.download_endpoint('token', 'tags')
+        self.assertIn('tags.csv', os.listdir(comp.tables_out_path))
+        os.remove(os.path.join(comp.tables_out_path, 'tags.csv'))
+
+        comp.download_endpoint('token', 'tags')
+        self.assertNotIn('tags.csv', os.listdir(comp.tables_out_path))
+
+    @mock.patch('retino_client.requests.Session.get')
+    def test_not_modified_response_skips_endpoint(self, get):
+        not_modified = mock.Mock(status_code=304, headers={})
+        get.return_value = not_modified
+        comp = self.build_component()
+        comp.settings_cache = True
+        comp.state = {"settingsCache": {"tags": {"version": component.SETTINGS_CACHE_VERSION, "etag": '"abc"',
+                                                 "hash": "0", "pages": 1}}}
+
+        comp.download_endpoint('token', 'tags')
+
+        self.assertEqual({'If-None-Match': '"abc"'}, get.call_args.kwargs['headers'])
+        self.assertEqual([], os.listdir(comp.tables_out_path))
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
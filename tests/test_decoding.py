@@ -0,0 +1,40 @@
+import json
+import unittest
+import mock
+import requests
+
+import decoding
+from decoding import StreamedPage
+
+
+def streamed_response(body, chunk_size=7):
+    response = mock.Mock()
+    payload = json.dumps(body).encode() if not isinstance(body, bytes) else body
+    response.iter_content.side_effect = lambda size: (payload[i:i + chunk_size]
+                                                      for i in range(0, len(payload), chunk_size))
+    return response
+
+
+@unittest.skipUnless(decoding.STREAMING_AVAILABLE, "ijson is not installed")
+class TestStreamedPage(unittest.TestCase):
+
+    def test_records_match_whole_decoding(self):
+        body = {"count": 2, "total_pages": 3,
+                "results": [{"id": 1, "price": 10.5, "items": [{"a": None}]}, {"id": 2, "name": "Č"}]}
+        page = StreamedPage(streamed_response(body))
+
+        self.assertEqual(body["results"], list(page))
+        self.assertEqual(3, page.total_pages)
+        self.assertEqual(2, page.records)
+
+    def test_total_pages_after_results(self):
+        page = StreamedPage(streamed_response({"results": [{"id": 1}], "total_pages": 5}))
+
+        self.assertEqual([{"id": 1}], list(page))
+        self.assertEqual(5, page.total_pages)
+
+    def test_invalid_json_is_request_error(self):
+        page = StreamedPage(streamed_response(b'{"total_pages": 1, "results": [{"id": 1}, {"id"'))
+
+        with self.assertRaises(requests.exceptions.RequestException):
+            list(page)
@@ -0,0 +1,28 @@
+import unittest
+
+from dedup import RecordIndex
+
+
+class TestRecordIndex(unittest.TestCase):
+
+    def test_later_copy_is_pending(self):
+        index = RecordIndex()
+
+        self.assertTrue(index.add({"id": 1, "code": "A"}))
+        self.assertTrue(index.add({"id": 9, "code": "B"}))
+        self.assertFalse(index.add({"id": 1, "code": "A2"}))
+        self.assertFalse(index.add({"id": 1, "code": "A3"}))
+
+        self.assertEqual({1: {"id": 1, "code": "A3"}}, index.pending)
+        self.assertEqual(2, index.duplicates)
+        self.assertEqual({"1"}, index.replaced_ids())
+
+    def test_ids_outside_bitmap(self):
+        index = RecordIndex()
+
+        for record_id in (2 ** 40, "abc", -1, 2 ** 40):
+            index.add({"id": record_id})
+
+        self.assertIn("abc", index)
+        self.assertNotIn(8, index)
+        self.assertEqual([2 ** 40], list(index.pending))
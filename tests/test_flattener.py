@@ -0,0 +1,59 @@
+import unittest
+
+from flattener import SCHEMAS, Column, Field, Flattener, Items, Key, Table, Translations, Value
+
+
+class ListTables:
+
+    def __init__(self):
+        self.rows = {}
+
+    def add_table(self, name, columns):
+        self.rows[name] = [columns]
+
+    def writer(self, name):
+        return ListWriter(self.rows[name])
+
+
+class ListWriter:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def writerows(self, rows):
+        self.rows.extend(rows)
+
+
+class TestFlattener(unittest.TestCase):
+
+    def test_nested_path_reads_every_level(self):
+        table = Table('_labels', primary_key=['option_id', 'language_code'],
+                      each=[Items('options'), Translations('label')],
+                      columns=[Column('field_id', Field('id', level=0)), Column('option_id', Field('id', level=1)),
+                               Column('language_code', Key()), Column('value', Value())])
+        record = {'id': 1, 'options': [{'id': 2, 'label': {'en': 'A', 'cs': 'B'}}, {'id': 3, 'label': {}}]}
+
+        self.assertEqual([[1, 2, 'en', 'A'], [1, 2, 'cs', 'B']], table.compile()(record))
+
+    def test_all_tables_written_in_single_pass(self):
+        tables = ListTables()
+        flattener = Flattener(SCHEMAS['custom-fields'], 'custom-fields', tables)
+        flattener.write({'id': 1, 'type': 'text', 'position': 2, 'name': {'en': 'Size'},
+                         'options': [{'id': 5, 'label': {'en': 'XL'}}]})
+
+        self.assertEqual({
+            'custom-fields_fields': [['id', 'type', 'position'], [1, 'text', 2]],
+            'custom-fields_names': [['field_id', 'language_code', 'value'], [1, 'en', 'Size']],
+            'custom-fields_options': [['id', 'field_id'], [5, 1]],
+            'custom-fields_option_labels': [['option_id', 'language_code', 'value'], [5, 'en', 'XL']],
+        }, tables.rows)
+
+    def test_missing_default_field(self):
+        table = SCHEMAS['tickets'].tables[3]
+        ticket = {'id': 1, 'history_items': [{'id': 2, 'history_item_type': 'note', 'history_item_data': {}}]}
+
+        self.assertEqual([[1, 2, 'note', '']], table.compile()(ticket))
+
+
+if __name__ == "__main__":
+    unittest.main()
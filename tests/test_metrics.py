@@ -0,0 +1,27 @@
+import unittest
+
+from metrics import RunMetrics, percentile
+
+
+class TestRunMetrics(unittest.TestCase):
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(1, percentile([1], 99))
+        self.assertIsNone(percentile([], 50))
+
+    def test_totals_sum_all_endpoints(self):
+        metrics = RunMetrics()
+        metrics.endpoint('tickets').record_request(0.2, 1000)
+        metrics.endpoint('tickets').add_rows({'tickets': 10, 'tickets_history': 30})
+        metrics.endpoint('tags').record_request(0.1, 100)
+        metrics.endpoint('tags').add_stage_time('write', 0.5)
+
+        totals = metrics.totals()
+
+        self.assertEqual(2, totals['requests'])
+        self.assertEqual(1100, totals['bytes_received'])
+        self.assertEqual(40, totals['rows_written'])
+        self.assertEqual({'write': 0.5}, totals['stage_seconds'])
@@ -0,0 +1,49 @@
+import json
+import tempfile
+import unittest
+import mock
+
+from page_cache import PageCache, PageCacheMiss
+from retino_client import RetinoClient
+
+
+@mock.patch('retino_client.requests.Session.get')
+class TestPageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_recorded_pages_are_replayed_without_requests(self, get):
+        body = {"results": [{"id": 1}], "total_pages": 2}
+        response = mock.Mock(status_code=200, headers={}, content=json.dumps(body).encode())
+        get.return_value = response
+        RetinoClient('token', page_cache=PageCache(self.folder.name, 'record')).get('tickets', {'page': 2, 'size': 5})
+        get.reset_mock()
+
+        client = RetinoClient('token', page_cache=PageCache(self.folder.name, 'replay'))
+
+        self.assertEqual(body, client.get_json('tickets', {'size': 5, 'page': 2}))
+        self.assertEqual([json.dumps(body).encode()], list(client.get('tickets', {'page': 2, 'size': 5})
+                                                           .iter_content(1024)))
+        get.assert_not_called()
+
+    def test_missing_page_fails_replay(self, get):
+        client = RetinoClient('token', page_cache=PageCache(self.folder.name, 'replay'))
+
+        with self.assertRaises(PageCacheMiss):
+            client.get('tickets', {'page': 3})
+        get.assert_not_called()
+
+    def test_replay_starts_downloads_with_recorded_parameters(self, get):
+        PageCache(self.folder.name, 'record').first_request('tickets', {'page': 3, 'updated_at_from': 'a'}, 20)
+
+        cache = PageCache(self.folder.name, 'replay')
+
+        self.assertEqual(({'page': 3, 'updated_at_from': 'a'}, 20),
+                         cache.first_request('tickets', {'page': 1, 'updated_at_from': 'b'}))
+        self.assertEqual(({'page': 1}, 0), cache.first_request('users', {'page': 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from paging import AdaptivePageSize
+
+
+class TestAdaptivePageSize(unittest.TestCase):
+
+    def read_all(self, sizer, total, elapsed=0.1, response_bytes=100):
+        """Simulates a page number based API and returns the offsets of all records read"""
+        offsets = []
+        offset = 0
+        while offset < total:
+            page, page_size = sizer.next_page(offset)
+            first = (page - 1) * page_size
+            offsets.extend(range(first, min(first + page_size, total)))
+            offset += page_size
+            sizer.record_success(elapsed, response_bytes)
+        return offsets
+
+    def test_grows_within_budget(self):
+        sizer = AdaptivePageSize(10, min_size=10, max_size=160)
+
+        self.assertEqual(list(range(1000)), self.read_all(sizer, 1000))
+        self.assertEqual(160, sizer.target)
+
+    def test_shrinks_over_budget(self):
+        sizer = AdaptivePageSize(100, min_size=10, max_size=1000, max_response_time=1.0)
+
+        sizer.record_success(2.0, 100)
+        self.assertEqual(40, sizer.target)
+        sizer.record_failure("timeout")
+        self.assertEqual(20, sizer.target)
+
+    def test_pages_stay_aligned_after_growth(self):
+        sizer = AdaptivePageSize(10, min_size=10, max_size=1000)
+        sizer.target = 40
+
+        # 30 records were read with pages of 10, so the next page must still have 10 records
+        self.assertEqual((4, 10), sizer.next_page(30))
+        self.assertEqual((2, 40), sizer.next_page(40))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import pstats
+import tempfile
+import unittest
+
+from profiling import StageProfiler
+
+
+def allocate():
+    return [str(number) * 10 for number in range(20000)]
+
+
+class TestStageProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = StageProfiler(enabled=True)
+        self.profiler.start()
+        self.addCleanup(self.profiler.stop)
+
+    def test_repeated_stage_is_merged(self):
+        for _ in range(2):
+            with self.profiler.stage('tickets'):
+                allocate()
+
+        self.assertEqual(['tickets'], self.profiler.stages)
+        report = self.profiler.report('tickets')
+        self.assertIn('Stage tickets: 2 runs', report)
+        self.assertIn('allocate', report)
+        self.assertIn('Top allocations', report)
+
+    def test_nested_stage_is_excluded_from_outer_stage(self):
+        with self.profiler.stage('tickets'):
+            with self.profiler.stage('manifests'):
+                allocate()
+
+        self.assertEqual(['manifests', 'tickets'], self.profiler.stages)
+        self.assertNotIn('allocate', self.profiler.report('tickets'))
+        self.assertIn('allocate', self.profiler.report('manifests'))
+
+    def test_stage_is_written_as_profile_and_report(self):
+        with self.profiler.stage('tags'):
+            allocate()
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        profile_path = os.path.join(folder.name, 'tags.prof')
+        report_path = os.path.join(folder.name, 'tags.txt')
+
+        self.profiler.write_stage('tags', profile_path, report_path)
+
+        self.assertTrue(any(function[2] == 'allocate' for function in pstats.Stats(profile_path).stats))
+        with open(report_path) as report_file:
+            self.assertTrue(report_file.read().startswith('Stage tags: 1 runs'))
+
+    def test_disabled_profiler_records_nothing(self):
+        profiler = StageProfiler()
+        with profiler.stage('tickets'):
+            allocate()
+
+        self.assertEqual([], profiler.stages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import mock
+
+from ratelimit import RateLimiter
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.multiple('ratelimit.time', monotonic=self.clock.monotonic, sleep=self.clock.sleep,
+                                      time=lambda: 1700000000.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_rate(self):
+        limiter = RateLimiter(rate=2, burst=3)
+
+        for _ in range(5):
+            limiter.acquire()
+
+        self.assertEqual([0.5, 0.5], self.clock.sleeps)
+
+    def test_unlimited_until_throttled(self):
+        limiter = RateLimiter()
+        for _ in range(8):
+            limiter.acquire()
+        self.assertEqual([], self.clock.sleeps)
+
+        with self.assertLogs(level='WARNING'):
+            limiter.throttle(3.0)
+        limiter.acquire()
+
+        self.assertEqual(4.0, limiter.rate)
+        self.assertEqual(3.0, sum(self.clock.sleeps))
+
+    def test_rate_recovers_up_to_configured_rate(self):
+        limiter = RateLimiter(rate=10)
+        with self.assertLogs(level='WARNING'):
+            limiter.throttle(0)
+
+        for _ in range(100):
+            limiter.observe({})
+
+        self.assertEqual(10, limiter.rate)
+
+    def test_concurrent_throttles_decrease_rate_once(self):
+        limiter = RateLimiter(rate=10)
+
+        with self.assertLogs(level='WARNING') as logs:
+            for delay in [2.0, 2.0, 3.0, 2.0, 2.0, 2.0]:
+                limiter.throttle(delay)
+        limiter.acquire()
+
+        self.assertEqual(5, limiter.rate)
+        self.assertEqual(6, limiter.throttles)
+        self.assertEqual(1, len(logs.output))
+        self.assertEqual(3.0, self.clock.sleeps[0])
+
+    def test_throttle_after_pause_decreases_rate_again(self):
+        limiter = RateLimiter(rate=10)
+
+        with self.assertLogs(level='WARNING'):
+            limiter.throttle(2.0)
+            self.clock.now += 2.0
+            limiter.throttle(2.0)
+
+        self.assertEqual(2.5, limiter.rate)
+
+    def test_no_remaining_requests_pause_until_reset(self):
+        limiter = RateLimiter()
+
+        limiter.observe({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(1700000000 + 7)})
+        limiter.acquire()
+
+        self.assertEqual([7.0], self.clock.sleeps)
+
+
+if __name__ == "__main__":
+    unittest.main()
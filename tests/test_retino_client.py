@@ -0,0 +1,90 @@
+import json
+import unittest
+import mock
+import requests
+
+from metrics import RunMetrics
+from retino_client import RetinoClient
+
+
+def response(status_code, headers=None, body=None):
+    result = mock.Mock()
+    result.status_code = status_code
+    result.headers = headers or {}
+    result.json.return_value = body
+    result.content = json.dumps(body).encode()
+    if status_code >= 400:
+        result.raise_for_status.side_effect = requests.exceptions.HTTPError(f"{status_code} error")
+    return result
+
+
+@mock.patch('retino_client.time.sleep')
+@mock.patch('retino_client.requests.Session.get')
+class TestRetinoClient(unittest.TestCase):
+
+    def test_session_requests_compression(self, get, sleep):
+        client = RetinoClient('token')
+
+        self.assertEqual('Token token', client.session.headers['Authorization'])
+        self.assertIn('gzip', client.session.headers['Accept-Encoding'])
+
+    def test_retry_after_is_honored(self, get, sleep):
+        get.side_effect = [response(429, {'Retry-After': '3'}), response(502), response(200, body={'results': []})]
+        client = RetinoClient('token')
+
+        self.assertEqual({'results': []}, client.get_json('tickets', {'page': 7}))
+        self.assertEqual(3, get.call_count)
+        self.assertEqual(3.0, sleep.call_args_list[0].args[0])
+        self.assertTrue(all(call.kwargs['params'] == {'page': 7} for call in get.call_args_list))
+
+    def test_throttled_request_slows_down_shared_limiter(self, get, sleep):
+        get.side_effect = [response(429, {'Retry-After': '2'}), response(200, body={'results': []})]
+        limiter = mock.Mock()
+        client = RetinoClient('token', rate_limiter=limiter)
+
+        client.get_json('tickets')
+
+        self.assertEqual(2, limiter.acquire.call_count)
+        limiter.throttle.assert_called_once_with(2.0)
+        limiter.observe.assert_called_once()
+
+    def test_client_error_is_not_retried(self, get, sleep):
+        get.return_value = response(404)
+        client = RetinoClient('token')
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.get('tickets')
+        self.assertEqual(1, get.call_count)
+
+    def test_retries_are_limited(self, get, sleep):
+        get.return_value = response(503)
+        client = RetinoClient('token', max_retries=2)
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.get('tickets')
+        self.assertEqual(3, get.call_count)
+
+    def test_fail_fast_does_not_retry_server_errors(self, get, sleep):
+        get.side_effect = [response(429), response(502)]
+        client = RetinoClient('token')
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.get('tickets', fail_fast=True)
+        self.assertEqual(2, get.call_count)
+
+    def test_failed_requests_are_recorded(self, get, sleep):
+        get.side_effect = [response(404), requests.exceptions.ConnectionError("refused")]
+        metrics = RunMetrics()
+        client = RetinoClient('token', max_retries=0, metrics=metrics)
+
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.RequestException):
+                client.get('tickets')
+
+        report = metrics.endpoint('tickets').to_dict()
+        self.assertEqual((0, 2), (report['requests'], report['failed_requests']))
+        self.assertIsNotNone(report['latency_seconds']['max'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import csv
+import gzip
+import os
+import tempfile
+import unittest
+
+from writers import TableWriterSet
+
+
+class TestTableWriterSet(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_rows_written_through_open_handles(self):
+        with TableWriterSet(self.folder.name, buffer_size=16) as tables:
+            path = tables.add_table('tickets', ['id', 'code'])
+            tables.writerow('tickets', [1, 'A'])
+            tables.writerows('tickets', [[2, 'B'], [3, 'C']])
+
+        with open(path, newline='') as file:
+            self.assertEqual([['id', 'code'], ['1', 'A'], ['2', 'B'], ['3', 'C']], list(csv.reader(file)))
+
+    def test_failure_removes_files(self):
+        with self.assertRaises(RuntimeError):
+            with TableWriterSet(self.folder.name) as tables:
+                tables.add_table('tickets', ['id'])
+                raise RuntimeError()
+
+        self.assertEqual([], os.listdir(self.folder.name))
+
+    def test_sliced_table_has_compressed_slices_without_header(self):
+        with TableWriterSet(self.folder.name, slice_rows=2, sliced_tables=['history']) as tables:
+            history_path = tables.add_table('history', ['ticket_id', 'id'])
+            tables.add_table('tickets', ['id'])
+            tables.writerows('history', [[1, 1], [1, 2], [2, 3]])
+
+        self.assertEqual({'history'}, tables.sliced)
+        self.assertEqual(['part-00001.csv.gz', 'part-00002.csv.gz'], sorted(os.listdir(history_path)))
+        with gzip.open(os.path.join(history_path, 'part-00002.csv.gz'), 'rt', newline='') as file:
+            self.assertEqual([['2', '3']], list(csv.reader(file)))
+
+    def test_filter_rows_numbers_rows_across_slices(self):
+        with TableWriterSet(self.folder.name, slice_rows=2) as tables:
+            path = tables.add_table('history', ['ticket_id', 'id'])
+            tables.writerows('history', [[1, 1], [2, 2], [1, 3], [2, 4]])
+        tables.close()
+
+        removed = tables.filter_rows('history', lambda index, row: index >= 3 or row[0] != '2')
+
+        self.assertEqual(1, removed)
+        rows = []
+        for slice_name in sorted(os.listdir(path)):
+            with gzip.open(os.path.join(path, slice_name), 'rt', newline='') as file:
+                rows.extend(csv.reader(file))
+        self.assertEqual([['1', '1'], ['1', '3'], ['2', '4']], rows)
+
+    def test_csv_chunks_start_a_slice_only_between_chunks(self):
+        with TableWriterSet(self.folder.name, slice_rows=3) as tables:
+            path = tables.add_table('history', ['ticket_id', 'id'])
+            tables.write_csv('history', '1,1\r\n1,2\r\n', 2)
+            tables.write_csv('history', '2,3\r\n2,4\r\n', 2)
+
+        slices = []
+        for slice_name in sorted(os.listdir(path)):
+            with gzip.open(os.path.join(path, slice_name), 'rt', newline='') as file:
+                slices.append(list(csv.reader(file)))
+        self.assertEqual([[['1', '1'], ['1', '2']], [['2', '3'], ['2', '4']]], slices)
+
+    def test_failure_removes_sliced_tables(self):
+        with self.assertRaises(RuntimeError):
+            with TableWriterSet(self.folder.name, slice_rows=10) as tables:
+                tables.add_table('history', ['id'])
+                raise RuntimeError()
+
+        self.assertEqual([], os.listdir(self.folder.name))
+
+
+if __name__ == "__main__":
+    unittest.main()